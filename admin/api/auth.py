@@ -1,7 +1,12 @@
 import jwt
 import bcrypt
+import hashlib
+import threading
+import time
+from cachetools import TTLCache
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Annotated, Optional, Union
+from fastapi import Depends, HTTPException, Request
 import os
 from dotenv import load_dotenv
 
@@ -11,16 +16,29 @@ JWT_SECRET = os.getenv("JWT_SECRET")
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
 
+# bcrypt work factor; each +1 doubles hashing time
+BCRYPT_COST = int(os.getenv("BCRYPT_COST", "12"))
+
 # Malaysian timezone (UTC+8)
 MYT = timezone(timedelta(hours=8))
 
 
 def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=BCRYPT_COST)).decode()
+
 
+# Compared against when the username doesn't exist so failed logins take
+# the same time either way and don't reveal which usernames are valid
+DUMMY_HASH = hash_password("x").encode()
 
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode(), hashed.encode())
+
+def verify_password(password: Union[str, bytes], hashed: Union[str, bytes]) -> bool:
+    # Accept bytes so callers holding encoded values skip the round-trip
+    if isinstance(password, str):
+        password = password.encode()
+    if isinstance(hashed, str):
+        hashed = hashed.encode()
+    return bcrypt.checkpw(password, hashed)
 
 
 def create_token(username: str) -> str:
@@ -33,11 +51,57 @@ def create_token(username: str) -> str:
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
 
-def verify_token(token: str) -> Optional[str]:
+def _decode_token(token: str) -> Optional[dict]:
+    """Validate the token with PyJWT (signature, exp, iat/nbf); returns the payload or None."""
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload.get("sub")
-    except jwt.ExpiredSignatureError:
-        return None
+        return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM], options={"require": ["exp"]})
     except jwt.InvalidTokenError:
         return None
+
+
+# Verified tokens: {blake2b(token): (username, exp_timestamp)}. Hashed keys keep raw
+# tokens out of memory; the short TTL bounds how long a revoked secret keeps working.
+_token_cache = TTLCache(maxsize=4096, ttl=60)
+_token_cache_lock = threading.Lock()
+
+
+def _token_key(token: str) -> bytes:
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+def verify_token(token: str) -> Optional[str]:
+    key = _token_key(token)
+    with _token_cache_lock:
+        cached = _token_cache.get(key)
+    if cached:
+        username, exp_ts = cached
+        if time.time() < exp_ts:
+            return username
+    
+    payload = _decode_token(token)
+    username = payload.get("sub") if payload else None
+    with _token_cache_lock:
+        if username:
+            _token_cache[key] = (username, payload["exp"])
+        else:
+            _token_cache.pop(key, None)
+    return username
+
+
+def get_current_admin(request: Request) -> str:
+    """Admin username for the request; reuses AuthMiddleware's result when present."""
+    username = getattr(request.state, "admin", None)
+    if username:
+        return username
+    
+    header = request.headers.get("authorization", "").encode("latin-1")
+    if not header.startswith(b"Bearer "):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    username = verify_token(header[7:].decode("latin-1"))
+    if not username:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    return username
+
+
+# FastAPI caches dependencies per request, so sub-dependencies share one lookup
+CurrentAdmin = Annotated[str, Depends(get_current_admin, use_cache=True)]
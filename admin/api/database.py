@@ -1,7 +1,6 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Text, ForeignKey
+from sqlalchemy import create_engine, event, Column, Integer, String, Boolean, DateTime, Text, ForeignKey, Index, func
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
-from datetime import datetime
 import os
 
 # Get project root (two levels up from admin/api)
@@ -11,10 +10,32 @@ os.makedirs(DATA_DIR, exist_ok=True)
 
 DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{os.path.join(DATA_DIR, 'bot.db')}")
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    pool_size=20,
+    max_overflow=10,
+    pool_pre_ping=True
+)
+
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_conn, _):
+    # WAL lets the admin API read while the bot writes; mmap serves reads from memory
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.close()
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Timestamps use SQL CURRENT_TIMESTAMP (UTC). default= renders it inline in the
+# INSERT so tables created before server_default existed still get a value.
+
 
 class AdminUser(Base):
     __tablename__ = "admin_users"
@@ -22,7 +43,7 @@ class AdminUser(Base):
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, nullable=False)
     password_hash = Column(String, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=func.now(), server_default=func.now())
 
 
 class InviteCode(Base):
@@ -34,10 +55,12 @@ class InviteCode(Base):
     phone = Column(String, nullable=True)
     telegram_id = Column(Integer, nullable=True)
     is_used = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=func.now(), server_default=func.now())
     used_at = Column(DateTime, nullable=True)
     
-    user = relationship("User", back_populates="invite", uselist=False)
+    # Read-only back-references: nothing in the admin API traverses these, so
+    # they raise instead of issuing a silent per-row SELECT
+    user = relationship("User", back_populates="invite", uselist=False, lazy="raise", viewonly=True)
 
 
 class User(Base):
@@ -52,10 +75,10 @@ class User(Base):
     is_allowed = Column(Boolean, default=True)
     voice_enabled = Column(Boolean, default=False)
     last_activity = Column(DateTime, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=func.now(), server_default=func.now())
     
     invite = relationship("InviteCode", back_populates="user")
-    chat_logs = relationship("ChatLog", back_populates="user")
+    chat_logs = relationship("ChatLog", back_populates="user", lazy="raise", viewonly=True)
 
 
 class ChatLog(Base):
@@ -67,9 +90,15 @@ class ChatLog(Base):
     content = Column(Text, nullable=True)
     file_name = Column(String, nullable=True)
     bot_response = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=func.now(), server_default=func.now())
+    
+    user = relationship("User", back_populates="chat_logs", lazy="raise", viewonly=True)
     
-    user = relationship("User", back_populates="chat_logs")
+    # Match the admin log filters, which all sort by created_at
+    __table_args__ = (
+        Index("ix_chatlog_user_created", "user_id", "created_at"),
+        Index("ix_chatlog_msgtype_created", "message_type", "created_at"),
+    )
 
 
 class UserPreference(Base):
@@ -83,8 +112,8 @@ class UserPreference(Base):
     log_sheet_id = Column(String, nullable=True)              # Quotation log Sheet ID
     email_cc = Column(String, nullable=True)                  # Default CC email
     quotation_validity_days = Column(Integer, default=30)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, default=func.now(), server_default=func.now())
+    updated_at = Column(DateTime, default=func.now(), server_default=func.now(), onupdate=func.now())
 
 
 class UserCatalogue(Base):
@@ -97,8 +126,13 @@ class UserCatalogue(Base):
     file_type = Column(String, nullable=False)                # "pdf" or "sheet"
     drive_file_id = Column(String, nullable=True)             # Google Drive file ID
     chroma_collection = Column(String, nullable=True)         # ChromaDB collection name
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, default=func.now(), server_default=func.now())
+    updated_at = Column(DateTime, default=func.now(), server_default=func.now(), onupdate=func.now())
+    
+    # Conflict target for the bot's catalogue UPSERT
+    __table_args__ = (
+        Index("ux_user_cat", "telegram_id", "name", unique=True),
+    )
 
 
 class QuotationLog(Base):
@@ -116,8 +150,8 @@ class QuotationLog(Base):
     pdf_file_id = Column(String, nullable=True)               # Google Drive PDF ID
     status = Column(String, default="pending")                # pending, sent, cancelled
     version = Column(Integer, default=1)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, default=func.now(), server_default=func.now())
+    updated_at = Column(DateTime, default=func.now(), server_default=func.now(), onupdate=func.now())
 
 
 def init_db():
@@ -133,6 +167,25 @@ def init_db():
             print("[DB] Added voice_enabled column to users table")
         except Exception:
             pass  # Column already exists
+        
+        # Indexes for log pagination on databases created before they were declared
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_chatlog_user_created ON chat_logs (user_id, created_at)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_chatlog_msgtype_created ON chat_logs (message_type, created_at)"))
+        
+        # One catalogue per (user, name). Duplicates from before the index each have their own
+        # indexed items and Drive file, so they're reported rather than deleted; the bot keeps
+        # saving without the UPSERT until they're merged by hand.
+        duplicates = conn.execute(text(
+            "SELECT telegram_id, name, COUNT(*) FROM user_catalogues "
+            "GROUP BY telegram_id, name HAVING COUNT(*) > 1"
+        )).fetchall()
+        if duplicates:
+            for telegram_id, name, count in duplicates:
+                print(f"[DB] Duplicate catalogue '{name}' for user {telegram_id} ({count} rows)")
+            print("[DB] Skipping unique index ux_user_cat until duplicate catalogues are merged")
+        else:
+            conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ux_user_cat ON user_catalogues (telegram_id, name)"))
+        conn.commit()
 
 
 def get_db():
@@ -2,20 +2,28 @@ from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
+from starlette.exceptions import HTTPException as StarletteHTTPException
 from sqlalchemy.orm import Session
+from functools import lru_cache
+import time
 import os
 
 from .database import init_db, get_db, AdminUser, SessionLocal
 from .models import LoginRequest, TokenResponse, AdminUserResponse
-from .auth import hash_password, verify_password, create_token, verify_token
+from .auth import hash_password, verify_password, create_token, BCRYPT_COST, DUMMY_HASH, CurrentAdmin
+from .middleware import AuthMiddleware
+from .responses import ORJSONResponse
 from .routes.users import router as users_router
 from .routes.invites import router as invites_router
 from .routes.logs import router as logs_router
 from .routes.google_oauth import router as google_router
 
-app = FastAPI(title="GT-Bot Admin", version="1.0.0")
+app = FastAPI(title="GT-Bot Admin", version="1.0.0", default_response_class=ORJSONResponse)
 
-# CORS
+# Auth (pure ASGI, added first so CORS wraps it and answers preflights)
+app.add_middleware(AuthMiddleware)
+
+# CORS (Starlette's CORSMiddleware is already pure ASGI)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -34,6 +42,7 @@ app.include_router(google_router, prefix="/api")
 @app.on_event("startup")
 def startup():
     init_db()
+    print(f"Using bcrypt cost: {BCRYPT_COST}")
     
     # Create default admin user if not exists
     db = SessionLocal()
@@ -56,8 +65,13 @@ def startup():
 
 @app.post("/api/auth/login", response_model=TokenResponse)
 def login(request: LoginRequest, db: Session = Depends(get_db)):
+    # A plain def: FastAPI runs it in its threadpool, so neither the DB lookup nor the
+    # CPU-bound bcrypt check blocks the event loop
     user = db.query(AdminUser).filter(AdminUser.username == request.username).first()
-    if not user or not verify_password(request.password, user.password_hash):
+    password_hash = user.password_hash if user else DUMMY_HASH
+    
+    valid = verify_password(request.password, password_hash)
+    if not user or not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     token = create_token(user.username)
@@ -65,15 +79,7 @@ def login(request: LoginRequest, db: Session = Depends(get_db)):
 
 
 @app.get("/api/auth/me", response_model=AdminUserResponse)
-def get_me(authorization: str = None, db: Session = Depends(get_db)):
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Missing token")
-    
-    token = authorization.split(" ")[1]
-    username = verify_token(token)
-    if not username:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
+def get_me(username: CurrentAdmin, db: Session = Depends(get_db)):
     user = db.query(AdminUser).filter(AdminUser.username == username).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -83,37 +89,43 @@ def get_me(authorization: str = None, db: Session = Depends(get_db)):
 
 # Serve React static files (dist folder copied to static during build)
 STATIC_DIR = os.path.join(os.path.dirname(__file__), "static")
+INDEX_HTML = os.path.join(STATIC_DIR, "index.html")
 
-if os.path.exists(STATIC_DIR):
-    assets_dir = os.path.join(STATIC_DIR, "assets")
-    if os.path.exists(assets_dir):
-        app.mount("/assets", StaticFiles(directory=assets_dir), name="assets")
-    
-    # All client routes - serve React SPA
-    # These routes are handled by React Router on the frontend
-    @app.get("/")
-    @app.get("/privacy")
-    @app.get("/terms")
-    @app.get("/login")
-    @app.get("/users")
-    @app.get("/invites")
-    @app.get("/logs")
-    @app.get("/logs/conversation/{user_id}")
-    async def serve_spa(user_id: int = None):
-        return FileResponse(os.path.join(STATIC_DIR, "index.html"))
+
+@lru_cache(maxsize=1)
+def _index_stat(_bucket: int) -> os.stat_result:
+    return os.stat(INDEX_HTML)
+
+
+@lru_cache(maxsize=1)
+def _static_files(_bucket: int) -> frozenset:
+    """Relative paths of every file in the build, so lookups need no stat() calls."""
+    return frozenset(
+        os.path.relpath(os.path.join(root, name), STATIC_DIR).replace(os.sep, "/")
+        for root, _, files in os.walk(STATIC_DIR)
+        for name in files
+    )
+
+
+class SPAStaticFiles(StaticFiles):
+    """Static files that fall back to index.html so React Router handles client routes."""
     
-    # Catch-all for other routes (SPA routing)
-    @app.get("/{path:path}")
-    async def serve_react(path: str):
+    async def get_response(self, path: str, scope):
+        if scope["method"] not in ("GET", "HEAD"):
+            raise StarletteHTTPException(status_code=405)
+        
         # Don't intercept API calls or docs
-        if path.startswith("api/") or path.startswith("docs") or path.startswith("openapi.json"):
-            raise HTTPException(status_code=404, detail="Not found")
-            
-        # Check if file exists in static directory (for assets)
-        file_path = os.path.join(STATIC_DIR, path)
-        if os.path.exists(file_path) and os.path.isfile(file_path):
-            return FileResponse(file_path)
-            
-        # All other routes go to React SPA
-        return FileResponse(os.path.join(STATIC_DIR, "index.html"))
+        if path.startswith(("api/", "docs", "openapi.json")):
+            raise StarletteHTTPException(status_code=404)
+        
+        # Known build files (rescanned every minute) and "/" go through StaticFiles
+        if path == "." or path in _static_files(int(time.monotonic() // 60)):
+            return await super().get_response(path, scope)
+        
+        # Client-side route: serve index.html, re-statting it at most every 5 seconds
+        return FileResponse(INDEX_HTML, stat_result=_index_stat(int(time.monotonic() // 5)))
 
+
+if os.path.exists(STATIC_DIR):
+    # Mounted last so the API routes above match first
+    app.mount("/", SPAStaticFiles(directory=STATIC_DIR, html=True), name="spa")
@@ -0,0 +1,61 @@
+"""
+Pure ASGI middleware for the admin API.
+Runs before routing so protected endpoints don't need per-route auth dependencies.
+"""
+import json
+from urllib.parse import parse_qs
+
+from .auth import verify_token
+
+# API paths that don't require an admin token
+PUBLIC_PATHS = ("/api/auth/login", "/api/google/")
+
+
+async def _unauthorized(send, detail: str):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 401,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AuthMiddleware:
+    """Verify the admin bearer token on /api/ requests and store the username in scope state."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+
+        path = scope["path"]
+        if not path.startswith("/api/") or path.startswith(PUBLIC_PATHS):
+            return await self.app(scope, receive, send)
+
+        token = None
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                if not value.startswith(b"Bearer "):
+                    return await _unauthorized(send, "Invalid token format")
+                token = value[7:].decode("latin-1")
+                break
+
+        if token is None and path.endswith("/media"):
+            # Media is loaded via <img>/<a> tags which can't set headers
+            token = parse_qs(scope["query_string"].decode("latin-1")).get("token", [None])[0]
+
+        if not token:
+            return await _unauthorized(send, "Authentication required")
+
+        username = verify_token(token)
+        if not username:
+            return await _unauthorized(send, "Invalid or expired token")
+
+        scope.setdefault("state", {})["admin"] = username
+        await self.app(scope, receive, send)
@@ -81,7 +81,8 @@ class ChatLogResponse(BaseModel):
 
 class PaginatedLogs(BaseModel):
     items: List[ChatLogResponse]
-    total: int
+    total: Optional[int] = None        # Omitted when paginating by cursor
     page: int
     limit: int
-    pages: int
+    pages: Optional[int] = None
+    next_cursor: Optional[str] = None
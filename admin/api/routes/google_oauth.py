@@ -4,11 +4,89 @@ Handles OAuth callback and status checking.
 """
 from fastapi import APIRouter, Query, HTTPException
 from fastapi.responses import HTMLResponse
+import html
 import sys
 sys.path.insert(0, '/app')
 
 router = APIRouter(prefix="/google", tags=["google"])
 
+_SUCCESS_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Google Account Linked</title>
+    <style>
+        body {
+            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
+            display: flex;
+            justify-content: center;
+            align-items: center;
+            height: 100vh;
+            margin: 0;
+            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+            color: white;
+        }
+        .container {
+            text-align: center;
+            padding: 40px;
+            background: rgba(255,255,255,0.1);
+            border-radius: 20px;
+            backdrop-filter: blur(10px);
+        }
+        h1 { font-size: 3em; margin-bottom: 10px; }
+        p { font-size: 1.2em; opacity: 0.9; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>✅</h1>
+        <h2>Google Account Linked!</h2>
+        <p>{{MSG}}</p>
+        <p>You can now close this window and return to Telegram.</p>
+    </div>
+</body>
+</html>
+""".encode()
+
+_ERROR_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Error</title>
+    <style>
+        body {
+            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
+            display: flex;
+            justify-content: center;
+            align-items: center;
+            height: 100vh;
+            margin: 0;
+            background: linear-gradient(135deg, #f06 0%, #f79 100%);
+            color: white;
+        }
+        .container {
+            text-align: center;
+            padding: 40px;
+            background: rgba(255,255,255,0.1);
+            border-radius: 20px;
+        }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>❌</h1>
+        <h2>Error Linking Account</h2>
+        <p>{{MSG}}</p>
+    </div>
+</body>
+</html>
+""".encode()
+
+# Pre-split once so each response is just two concatenations
+SUCCESS_HTML_HEAD, SUCCESS_HTML_TAIL = _SUCCESS_TEMPLATE.split(b"{{MSG}}")
+ERROR_HTML_HEAD, ERROR_HTML_TAIL = _ERROR_TEMPLATE.split(b"{{MSG}}")
+HTML_MEDIA_TYPE = "text/html; charset=utf-8"
+
 
 @router.get("/callback")
 async def google_oauth_callback(code: str = Query(...), state: str = Query(...)):
@@ -21,80 +99,20 @@ async def google_oauth_callback(code: str = Query(...), state: str = Query(...))
         from agent.google_auth import exchange_code
         
         success, message, telegram_id = exchange_code(code, state)
+        message = html.escape(message).encode()
         
         if success:
             # Return a nice success page
-            return HTMLResponse(f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <title>Google Account Linked</title>
-                <style>
-                    body {{
-                        font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
-                        display: flex;
-                        justify-content: center;
-                        align-items: center;
-                        height: 100vh;
-                        margin: 0;
-                        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                        color: white;
-                    }}
-                    .container {{
-                        text-align: center;
-                        padding: 40px;
-                        background: rgba(255,255,255,0.1);
-                        border-radius: 20px;
-                        backdrop-filter: blur(10px);
-                    }}
-                    h1 {{ font-size: 3em; margin-bottom: 10px; }}
-                    p {{ font-size: 1.2em; opacity: 0.9; }}
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <h1>✅</h1>
-                    <h2>Google Account Linked!</h2>
-                    <p>{message}</p>
-                    <p>You can now close this window and return to Telegram.</p>
-                </div>
-            </body>
-            </html>
-            """)
+            return HTMLResponse(
+                content=SUCCESS_HTML_HEAD + message + SUCCESS_HTML_TAIL,
+                media_type=HTML_MEDIA_TYPE
+            )
         else:
-            return HTMLResponse(f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <title>Error</title>
-                <style>
-                    body {{
-                        font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
-                        display: flex;
-                        justify-content: center;
-                        align-items: center;
-                        height: 100vh;
-                        margin: 0;
-                        background: linear-gradient(135deg, #f06 0%, #f79 100%);
-                        color: white;
-                    }}
-                    .container {{
-                        text-align: center;
-                        padding: 40px;
-                        background: rgba(255,255,255,0.1);
-                        border-radius: 20px;
-                    }}
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <h1>❌</h1>
-                    <h2>Error Linking Account</h2>
-                    <p>{message}</p>
-                </div>
-            </body>
-            </html>
-            """, status_code=400)
+            return HTMLResponse(
+                content=ERROR_HTML_HEAD + message + ERROR_HTML_TAIL,
+                status_code=400,
+                media_type=HTML_MEDIA_TYPE
+            )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
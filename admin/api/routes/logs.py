@@ -1,15 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, Header, Query
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import FileResponse, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import desc, func, literal, tuple_
+from cachetools import TTLCache
 from typing import Optional
 from datetime import datetime
+import base64
+import threading
 import os
 import math
 
 from ..database import get_db, ChatLog, User
-from ..models import ChatLogResponse, PaginatedLogs
-from ..auth import verify_token
+from ..models import PaginatedLogs
+from ..responses import ORJSONResponse
 
 router = APIRouter(prefix="/logs", tags=["logs"])
 
@@ -18,66 +21,96 @@ router = APIRouter(prefix="/logs", tags=["logs"])
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 UPLOADS_DIR = os.path.join(PROJECT_ROOT, "data", "uploads")
 
+# Short-lived totals for page-number pagination, keyed by filter tuple
+_count_cache = TTLCache(maxsize=1024, ttl=10)
+_count_cache_lock = threading.Lock()
 
 
+def _cached_count(key: tuple, query) -> int:
+    with _count_cache_lock:
+        total = _count_cache.get(key)
+    if total is None:
+        total = query.count()
+        with _count_cache_lock:
+            _count_cache[key] = total
+    return total
 
-def get_current_admin(authorization: str = Header(...)):
-    if not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid token format")
-    token = authorization.split(" ")[1]
-    username = verify_token(token)
-    if not username:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
-    return username
 
+def _encode_cursor(log: ChatLog) -> str:
+    raw = f"{log.created_at.isoformat()}|{log.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _after_cursor(cursor: str):
+    """Filter for rows after the cursor in (created_at DESC, id DESC) order."""
+    try:
+        ts, log_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        created_at = datetime.fromisoformat(ts)
+        log_id = int(log_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    # The bot stores created_at as 'YYYY-MM-DD HH:MM:SS' text, so compare in that format
+    fmt = "%Y-%m-%d %H:%M:%S.%f" if created_at.microsecond else "%Y-%m-%d %H:%M:%S"
+    return tuple_(ChatLog.created_at, ChatLog.id) < tuple_(literal(created_at.strftime(fmt)), literal(log_id))
 
 @router.get("/conversations")
 def list_conversations(
-    db: Session = Depends(get_db),
-    admin: str = Depends(get_current_admin)
+    db: Session = Depends(get_db)
 ):
     """Get a list of all conversations grouped by user"""
-    # Get all users who have chat logs
-    users_with_logs = db.query(
+    # Message count per user in a single aggregate query
+    stats = db.query(
+        ChatLog.user_id.label("user_id"),
+        func.count(ChatLog.id).label("message_count")
+    ).group_by(ChatLog.user_id).subquery()
+    
+    # Latest message per user, ranked in SQL instead of one query per user
+    last_msg = db.query(
+        ChatLog.user_id.label("user_id"),
+        ChatLog.content.label("content"),
+        ChatLog.message_type.label("message_type"),
+        ChatLog.created_at.label("created_at"),
+        func.row_number().over(
+            partition_by=ChatLog.user_id,
+            order_by=(ChatLog.created_at.desc(), ChatLog.id.desc())
+        ).label("rn")
+    ).subquery()
+    
+    rows = db.query(
         User.id,
         User.telegram_id,
         User.username,
         User.first_name,
-        User.last_name
-    ).join(ChatLog).distinct().all()
+        stats.c.message_count,
+        last_msg.c.content,
+        last_msg.c.message_type,
+        last_msg.c.created_at
+    ).join(
+        stats, stats.c.user_id == User.id
+    ).join(
+        last_msg, (last_msg.c.user_id == User.id) & (last_msg.c.rn == 1)
+    ).order_by(last_msg.c.created_at.desc().nullslast()).all()
     
     conversations = []
-    for user in users_with_logs:
-        # Get message count for this user
-        message_count = db.query(ChatLog).filter(ChatLog.user_id == user.id).count()
-        
-        # Get last message
-        last_log = db.query(ChatLog).filter(
-            ChatLog.user_id == user.id
-        ).order_by(desc(ChatLog.created_at)).first()
-        
+    for user_id, telegram_id, username, first_name, message_count, content, message_type, last_created in rows:
         # Get last message preview (truncate if too long)
-        last_message = None
-        if last_log:
-            if last_log.message_type == 'text' and last_log.content:
-                last_message = last_log.content[:50] + "..." if len(last_log.content) > 50 else last_log.content
-            else:
-                last_message = f"📎 {last_log.message_type.title() if last_log.message_type else 'File'}"
+        if message_type == 'text' and content:
+            last_message = content[:50] + "..." if len(content) > 50 else content
+        else:
+            last_message = f"📎 {message_type.title() if message_type else 'File'}"
         
-        user_name = user.first_name or user.username or f"User {user.telegram_id}"
+        user_name = first_name or username or f"User {telegram_id}"
         
         conversations.append({
-            "user_id": user.id,
-            "telegram_id": user.telegram_id,
+            "user_id": user_id,
+            "telegram_id": telegram_id,
             "user_name": user_name,
             "message_count": message_count,
             "last_message": last_message,
-            "last_activity": last_log.created_at if last_log else None
+            "last_activity": last_created
         })
     
-    # Sort by last activity
-    conversations.sort(key=lambda x: x["last_activity"] or datetime.min, reverse=True)
-    
     return conversations
 
 
@@ -89,8 +122,8 @@ def list_logs(
     to_date: Optional[datetime] = None,
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=1000),
-    db: Session = Depends(get_db),
-    admin: str = Depends(get_current_admin)
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
 ):
     query = db.query(ChatLog)
     
@@ -103,55 +136,52 @@ def list_logs(
     if to_date:
         query = query.filter(ChatLog.created_at <= to_date)
     
-    total = query.count()
-    pages = math.ceil(total / limit) if total > 0 else 1
-    
-    logs = query.order_by(desc(ChatLog.created_at)).offset((page - 1) * limit).limit(limit).all()
-    
-    items = []
-    for log in logs:
-        user = db.query(User).filter(User.id == log.user_id).first()
-        items.append(ChatLogResponse(
-            id=log.id,
-            user_id=log.user_id,
-            message_type=log.message_type,
-            content=log.content,
-            file_name=log.file_name,
-            bot_response=log.bot_response,
-            created_at=log.created_at,
-            user_name=user.first_name or user.username if user else None
-        ))
-    
-    return PaginatedLogs(
-        items=items,
-        total=total,
-        page=page,
-        limit=limit,
-        pages=pages
-    )
+    # Keyset pagination skips the COUNT(*) and OFFSET scan entirely
+    total = pages = None
+    offset = 0
+    if cursor:
+        query = query.filter(_after_cursor(cursor))
+    else:
+        total = _cached_count(("logs", user_id, message_type, from_date, to_date), query)
+        pages = math.ceil(total / limit) if total > 0 else 1
+        offset = (page - 1) * limit
+    
+    rows = query.add_columns(User.first_name, User.username).outerjoin(
+        User, User.id == ChatLog.user_id
+    ).order_by(desc(ChatLog.created_at), desc(ChatLog.id)).offset(offset).limit(limit).all()
+    
+    # Plain dicts straight to orjson; the shape still matches PaginatedLogs
+    items = [
+        {
+            "id": log.id,
+            "user_id": log.user_id,
+            "message_type": log.message_type,
+            "content": log.content,
+            "file_name": log.file_name,
+            "bot_response": log.bot_response,
+            "created_at": log.created_at,
+            "user_name": first_name or username
+        }
+        for log, first_name, username in rows
+    ]
+    
+    return ORJSONResponse({
+        "items": items,
+        "total": total,
+        "page": page,
+        "limit": limit,
+        "pages": pages,
+        "next_cursor": _encode_cursor(rows[-1][0]) if len(rows) == limit else None
+    })
 
 
 @router.get("/{log_id}/media")
 def get_media(
     log_id: int,
-    token: Optional[str] = Query(None),
-    authorization: Optional[str] = Header(None),
+    request: Request,
     db: Session = Depends(get_db)
 ):
-    # Verify token from either header or query parameter
-    auth_token = None
-    if authorization and authorization.startswith("Bearer "):
-        auth_token = authorization.split(" ")[1]
-    elif token:
-        auth_token = token
-    
-    if not auth_token:
-        raise HTTPException(status_code=401, detail="Authentication required")
-    
-    username = verify_token(auth_token)
-    if not username:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
-    
+    # Token (header or ?token= query) is verified by AuthMiddleware
     log = db.query(ChatLog).filter(ChatLog.id == log_id).first()
     if not log:
         raise HTTPException(status_code=404, detail="Log not found")
@@ -160,10 +190,40 @@ def get_media(
         raise HTTPException(status_code=400, detail="No media file for this log")
     
     file_path = os.path.join(UPLOADS_DIR, log.content)
-    if not os.path.exists(file_path):
+    try:
+        stat = os.stat(file_path)
+    except OSError:
         raise HTTPException(status_code=404, detail="File not found")
     
-    return FileResponse(file_path, filename=log.file_name or "file")
+    # Uploads never change in place, so mtime + size identifies the content
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=3600"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    
+    return FileResponse(file_path, filename=log.file_name or "file", stat_result=stat, headers=headers)
+
+
+def _expand(log: ChatLog) -> tuple:
+    """A log row as chat messages: the user's message, then the bot reply if any."""
+    user_msg = {
+        "id": log.id,
+        "sender": "user",
+        "message_type": log.message_type,
+        "content": log.content,
+        "file_name": log.file_name,
+        "created_at": log.created_at
+    }
+    if not log.bot_response:
+        return (user_msg,)
+    return (user_msg, {
+        "id": log.id,
+        "sender": "bot",
+        "message_type": "text",
+        "content": log.bot_response,
+        "file_name": None,
+        "created_at": log.created_at
+    })
 
 
 @router.get("/conversations/{user_id}/messages")
@@ -171,49 +231,39 @@ def get_conversation_messages(
     user_id: int,
     page: int = Query(1, ge=1),
     limit: int = Query(100, ge=1, le=1000),
-    db: Session = Depends(get_db),
-    admin: str = Depends(get_current_admin)
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
 ):
     """Get all messages for a specific user conversation"""
-    user = db.query(User).filter(User.id == user_id).first()
+    # Only the columns the header needs, not a full User entity
+    user = db.query(
+        User.id, User.telegram_id, User.first_name, User.username
+    ).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Get total count
-    total = db.query(ChatLog).filter(ChatLog.user_id == user_id).count()
+    query = db.query(ChatLog).filter(ChatLog.user_id == user_id)
+    
+    # Keyset pagination skips the COUNT(*) and OFFSET scan entirely
+    total = None
+    offset = 0
+    if cursor:
+        query = query.filter(_after_cursor(cursor))
+    else:
+        total = _cached_count(("messages", user_id), query)
+        offset = (page - 1) * limit
     
     # Get messages - Fetch latest first (DESC), then reverse for display
-    logs = db.query(ChatLog).filter(
-        ChatLog.user_id == user_id
-    ).order_by(desc(ChatLog.created_at)).offset((page - 1) * limit).limit(limit).all()
+    logs = query.order_by(desc(ChatLog.created_at), desc(ChatLog.id)).offset(offset).limit(limit).all()
+    next_cursor = _encode_cursor(logs[-1]) if len(logs) == limit else None
     
     # Reverse logs to maintain chronological order in the response (Oldest -> Newest)
     # This ensures the chat UI renders the context correctly
     logs.reverse()
     
-    messages = []
-    for log in logs:
-        messages.append({
-            "id": log.id,
-            "sender": "user",
-            "message_type": log.message_type,
-            "content": log.content,
-            "file_name": log.file_name,
-            "created_at": log.created_at
-        })
-        
-        # Add bot response as a separate message if it exists
-        if log.bot_response:
-            messages.append({
-                "id": log.id,
-                "sender": "bot",
-                "message_type": "text",
-                "content": log.bot_response,
-                "file_name": None,
-                "created_at": log.created_at
-            })
-    
-    return {
+    messages = [m for log in logs for m in _expand(log)]
+    
+    return ORJSONResponse({
         "user": {
             "id": user.id,
             "telegram_id": user.telegram_id,
@@ -222,5 +272,6 @@ def get_conversation_messages(
         "messages": messages,
         "total": total,
         "page": page,
-        "limit": limit
-    }
+        "limit": limit,
+        "next_cursor": next_cursor
+    })
@@ -4,9 +4,18 @@ Handles creation and management of explicit context caches.
 """
 import os
 import datetime
+from functools import lru_cache
 from google import genai
 from google.genai import types
 
+
+@lru_cache(maxsize=1)
+def get_genai_client():
+    """Process-wide Gemini client so every caller shares one HTTP connection pool."""
+    api_key = os.getenv("GEMINI_API_KEY")
+    return genai.Client(api_key=api_key) if api_key else None
+
+
 class CacheManager:
     def __init__(self, model_name: str = "gemini-1.5-flash-001"):
         self.api_key = os.getenv("GEMINI_API_KEY")
@@ -14,7 +23,7 @@ class CacheManager:
             print("[Cache] Warning: GEMINI_API_KEY not set. Caching disabled.")
             self.client = None
         else:
-            self.client = genai.Client(api_key=self.api_key)
+            self.client = get_genai_client()
             
         self.model_name = model_name
         self._active_cache = None
@@ -4,55 +4,182 @@ Supports PDF catalogues via Gemini Vision extraction and Google Sheets.
 """
 
 import os
+import re
 import json
 import io
+import shutil
+import sqlite3
+import threading
+import traceback
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import wraps
 from typing import Optional, List, Dict, Any
+from cachetools import LRUCache
 from langchain_core.tools import tool
-from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseUpload
 
-from .google_auth import get_credentials
-from .memory import memory_manager
+from .caching import get_genai_client
+from .google_auth import get_credentials, get_service, drive_quote
+from .memory import GoogleEmbeddings, memory_manager
+
+try:
+    from langchain_community.vectorstores import FAISS
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 
 # FAISS persistence directory (same as memory.py)
 FAISS_PERSIST_DIR = os.getenv("FAISS_PERSIST_DIR", "/app/data/faiss")
 
+# Page rendering for Gemini Vision: JPEG at 150 DPI, longest side capped at 1600px.
+# CATALOGUE_HIRES=1 restores the old 2x PNG for hard-to-read PDFs.
+CATALOGUE_HIRES = os.getenv("CATALOGUE_HIRES", "0") == "1"
+PAGE_DPI = 150
+PAGE_MAX_PX = 1600
+
+# Minimum normalized relevance (0-1) for a catalogue search hit
+CATALOGUE_MIN_RELEVANCE = float(os.getenv("CATALOGUE_MIN_RELEVANCE", "0.35"))
+
+# Texts per embedding request when indexing a catalogue
+EMBED_BATCH_SIZE = 100
+
+# Models for catalogue extraction; pages with more text than TEXT_PAGE_MIN_CHARS skip Vision
+VISION_MODEL = "gemini-2.5-flash-preview-05-20"
+TEXT_MODEL = "gemini-2.5-flash"
+TEXT_PAGE_MIN_CHARS = 200
+
+# Concurrent Gemini Vision calls when extracting a multi-page catalogue
+CATALOGUE_PARALLEL = int(os.getenv("CATALOGUE_PARALLEL", "8"))
+
+# Drive uploads: PDFs under 5MB skip the resumable session; larger ones stream in 1MB chunks
+RESUMABLE_UPLOAD_MIN = 5 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def _like_escape(value: str) -> str:
+    """Escape LIKE wildcards so user-supplied names match literally (use with ESCAPE '\\')."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+# One SQLite connection per thread instead of connect/close on every tool call
+_local = threading.local()
+
+
+def _get_conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        from bot.config import DATABASE_PATH
+        conn = sqlite3.connect(DATABASE_PATH)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA mmap_size=268435456")
+        _local.conn = conn
+    return conn
+
+
+# One search result; a tuple instead of a dict per hit
+CatalogueHit = namedtuple("CatalogueHit", ["content", "metadata", "relevance"])
+
+
+def _locked(method):
+    """Run a CatalogueIndex method under the instance lock."""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
 
 class CatalogueIndex:
-    """LangChain FAISS-based index for catalogue items."""
+    """LangChain FAISS index holding every catalogue item for one user, tagged by catalogue_id."""
     
-    def __init__(self, telegram_id: int, catalogue_id: int):
+    def __init__(self, telegram_id: int):
         self.telegram_id = telegram_id
-        self.catalogue_id = catalogue_id
-        self.index_dir = os.path.join(FAISS_PERSIST_DIR, f"catalogue_{telegram_id}_{catalogue_id}")
+        self.index_dir = os.path.join(FAISS_PERSIST_DIR, f"catalogue_{telegram_id}")
         
         os.makedirs(FAISS_PERSIST_DIR, exist_ok=True)
         
         # Get embedding function from memory module
-        from .memory import GoogleEmbeddings
         self.embedding_fn = GoogleEmbeddings()
         
-        # Initialize or load vector store
-        self.vector_store = None
-        self._load()
+        # Vector store is loaded on first use, so callers that never touch it pay nothing
+        self._vs = None
+        self._loaded = False
+        
+        # Instances are shared across threads via get_catalogue_index
+        self._lock = threading.RLock()
+    
+    @property
+    def vector_store(self):
+        if not self._loaded:
+            self._loaded = True
+            self._load()
+        return self._vs
+    
+    @vector_store.setter
+    def vector_store(self, value):
+        self._loaded = True
+        self._vs = value
     
     def _load(self):
         """Load existing index from disk."""
+        if not FAISS_AVAILABLE:
+            print("[Catalogue] langchain_community not installed; catalogue search disabled")
+            return
+        
         try:
-            from langchain_community.vectorstores import FAISS
-            
             if os.path.exists(self.index_dir):
                 self.vector_store = FAISS.load_local(
                     self.index_dir,
                     self.embedding_fn,
                     allow_dangerous_deserialization=True
                 )
-                print(f"[Catalogue] Loaded FAISS index for catalogue {self.catalogue_id}")
+                print(f"[Catalogue] Loaded FAISS index for user {self.telegram_id}")
+            else:
+                self._migrate()
         except Exception as e:
             print(f"[Catalogue] Error loading index: {e}")
             self.vector_store = None
     
+    def _migrate(self):
+        """Fold old per-catalogue indices (catalogue_{telegram_id}_{catalogue_id}) into this one."""
+        prefix = f"catalogue_{self.telegram_id}_"
+        legacy = [
+            name for name in os.listdir(FAISS_PERSIST_DIR)
+            if name.startswith(prefix) and name[len(prefix):].isdigit()
+        ]
+        if not legacy:
+            return
+        
+        for name in legacy:
+            store = FAISS.load_local(
+                os.path.join(FAISS_PERSIST_DIR, name),
+                self.embedding_fn,
+                allow_dangerous_deserialization=True
+            )
+            catalogue_id = int(name[len(prefix):])
+            for doc in store.docstore._dict.values():
+                doc.metadata["catalogue_id"] = catalogue_id
+            
+            if self.vector_store is None:
+                self.vector_store = store
+            else:
+                self.vector_store.merge_from(store)
+        
+        self._save()
+        for name in legacy:
+            shutil.rmtree(os.path.join(FAISS_PERSIST_DIR, name), ignore_errors=True)
+        print(f"[Catalogue] Migrated {len(legacy)} catalogue indices for user {self.telegram_id}")
+    
     def _save(self):
         """Save index to disk."""
         if self.vector_store:
@@ -61,60 +188,98 @@ class CatalogueIndex:
             except Exception as e:
                 print(f"[Catalogue] Error saving index: {e}")
     
-    def add_items(self, items: List[Dict]):
-        """Add items to the index."""
+    @_locked
+    def add_items(self, items: List[Dict], catalogue_id: int, catalogue_name: str = "") -> int:
+        """Add a catalogue's items to the index; returns how many were indexed."""
         if not items:
-            return
+            return 0
         
         try:
-            from langchain_community.vectorstores import FAISS
-            from langchain_core.documents import Document
-            
-            # Create documents with metadata
-            docs = []
+            # Skip empty fields, items with no text, and exact duplicates (every field equal).
+            # Gemini may return numbers for any field, so values are stringified.
+            texts = []
+            metadatas = []
+            seen = set()
             for item in items:
-                content = f"{item.get('name', '')} {item.get('description', '')} {item.get('item_code', '')}"
-                doc = Document(page_content=content, metadata=item)
-                docs.append(doc)
-            
-            if self.vector_store is None:
-                # Create new vector store
-                self.vector_store = FAISS.from_documents(docs, self.embedding_fn)
-            else:
-                # Add to existing
-                self.vector_store.add_documents(docs)
+                content = " ".join(str(item[key]) for key in ("name", "description", "item_code") if item.get(key))
+                key = tuple(sorted((k, str(v)) for k, v in item.items()))
+                if not content or key in seen:
+                    continue
+                seen.add(key)
+                texts.append(content)
+                metadatas.append({**item, "catalogue_id": catalogue_id, "catalogue_name": catalogue_name})
+            if not texts:
+                return 0
+            
+            # Embed in explicit batches (Gemini accepts up to 100 texts per request)
+            for i in range(0, len(texts), EMBED_BATCH_SIZE):
+                batch = texts[i:i + EMBED_BATCH_SIZE]
+                batch_meta = metadatas[i:i + EMBED_BATCH_SIZE]
+                vectors = self.embedding_fn.embed_documents(batch)
+                
+                if self.vector_store is None:
+                    # Create new vector store
+                    self.vector_store = FAISS.from_embeddings(list(zip(batch, vectors)), self.embedding_fn, metadatas=batch_meta)
+                else:
+                    # Add to existing
+                    self.vector_store.add_embeddings(list(zip(batch, vectors)), metadatas=batch_meta)
             
             self._save()
-            print(f"[Catalogue] Indexed {len(items)} items")
+            print(f"[Catalogue] Indexed {len(texts)} items")
+            return len(texts)
         except Exception as e:
             print(f"[Catalogue] Error adding items: {e}")
-            import traceback
             traceback.print_exc()
+            return 0
     
-    def search(self, query: str, n_results: int = 5) -> List[Dict]:
-        """Search the catalogue."""
+    @_locked
+    def search(self, query: str, n_results: int = 5, catalogue_ids: Optional[List[int]] = None) -> List[CatalogueHit]:
+        """Search the user's catalogues, optionally restricted to some catalogue_ids."""
         if not self.vector_store:
             return []
         
         try:
-            results = self.vector_store.similarity_search_with_score(query, k=n_results)
-            
-            formatted = []
-            for doc, score in results:
-                formatted.append({
-                    "content": doc.page_content,
-                    "metadata": doc.metadata,
-                    "distance": score
-                })
-            return formatted
+            kwargs = {}
+            if catalogue_ids is not None:
+                wanted = set(catalogue_ids)
+                kwargs["filter"] = lambda metadata: metadata.get("catalogue_id") in wanted
+                # The flat index scores every vector anyway; let the filter see all of them
+                kwargs["fetch_k"] = self.vector_store.index.ntotal
+            
+            # Relevance is normalized to [0, 1] and thresholded inside the vector store
+            results = self.vector_store.similarity_search_with_relevance_scores(
+                query, k=n_results, score_threshold=CATALOGUE_MIN_RELEVANCE, **kwargs
+            )
+            return [CatalogueHit(doc.page_content, doc.metadata, score) for doc, score in results]
         except Exception as e:
             print(f"[Catalogue] Error searching: {e}")
             return []
     
+    @_locked
+    def remove_catalogue(self, catalogue_id: int):
+        """Drop one catalogue's items from the index."""
+        if not self.vector_store:
+            return
+        
+        try:
+            ids = [
+                doc_id for doc_id, doc in self.vector_store.docstore._dict.items()
+                if doc.metadata.get("catalogue_id") == catalogue_id
+            ]
+            if ids:
+                self.vector_store.delete(ids)
+            
+            if self.vector_store.index.ntotal == 0:
+                self.clear()
+            else:
+                self._save()
+        except Exception as e:
+            print(f"[Catalogue] Error removing catalogue {catalogue_id}: {e}")
+    
+    @_locked
     def clear(self):
         """Clear the index."""
         try:
-            import shutil
             if os.path.exists(self.index_dir):
                 shutil.rmtree(self.index_dir)
             self.vector_store = None
@@ -122,32 +287,25 @@ class CatalogueIndex:
             print(f"[Catalogue] Error clearing: {e}")
 
 
-def get_catalogue_index(telegram_id: int, catalogue_id: int) -> CatalogueIndex:
-    """Get a catalogue index for a user."""
-    return CatalogueIndex(telegram_id, catalogue_id)
+# Loaded indexes stay in memory; saves and deletes mutate the cached instance, so it stays current
+_index_cache = LRUCache(maxsize=256)
+_index_cache_lock = threading.Lock()
 
 
-def extract_items_from_pdf_with_vision(pdf_bytes: bytes, telegram_id: int) -> List[Dict]:
-    """
-    Use Gemini Vision to extract items from PDF catalogue.
-    Converts PDF pages to images and sends to Gemini for extraction.
-    """
-    try:
-        from google import genai
-        import fitz  # PyMuPDF for PDF to image conversion
-        
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            print("[Catalogue] No GEMINI_API_KEY found")
-            return []
-        
-        client = genai.Client(api_key=api_key)
-        
-        # Open PDF and convert pages to images
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        all_items = []
-        
-        extraction_prompt = """
+def get_catalogue_index(telegram_id: int) -> CatalogueIndex:
+    """Get the catalogue index for a user."""
+    with _index_cache_lock:
+        index = _index_cache.get(telegram_id)
+        if index is None:
+            index = CatalogueIndex(telegram_id)
+            _index_cache[telegram_id] = index
+    return index
+
+
+# Body of a ```json / ``` fenced block in a model reply
+_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)```", re.S)
+
+EXTRACTION_PROMPT = """
 Analyze this catalogue page and extract ALL items/products you can find.
 For each item, extract:
 - item_code: Product code/SKU if available (or null)
@@ -164,45 +322,88 @@ Return ONLY a valid JSON array of objects. Example:
 
 If no items found, return empty array: []
 """
+
+
+def _extract_page(client, page_num: int, model: str, contents: list) -> List[Dict]:
+    """Send one page (image or extracted text) to Gemini; errors are logged and yield no items."""
+    try:
+        response = client.models.generate_content(model=model, contents=contents)
+        
+        # Parse response, unwrapping a markdown code block if there is one
+        text = response.text.strip()
+        match = _FENCE_RE.search(text)
+        items = _json_loads(match.group(1) if match else text)
+        if isinstance(items, list):
+            for item in items:
+                item["page"] = page_num + 1
+            print(f"[Catalogue] Page {page_num + 1}: Extracted {len(items)} items")
+            return items
+            
+    except json.JSONDecodeError as e:
+        print(f"[Catalogue] Page {page_num + 1}: JSON parse error - {e}")
+    except Exception as e:
+        print(f"[Catalogue] Page {page_num + 1}: Error - {e}")
+    return []
+
+
+def extract_items_from_pdf_with_vision(pdf_bytes: bytes, telegram_id: int) -> List[Dict]:
+    """
+    Use Gemini Vision to extract items from PDF catalogue.
+    Converts PDF pages to images and sends to Gemini for extraction.
+    """
+    try:
+        import fitz  # PyMuPDF for PDF to image conversion
         
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            print("[Catalogue] No GEMINI_API_KEY found")
+            return []
+        
+        client = get_genai_client()
+        
+        # Prepare every page first (PyMuPDF isn't thread-safe), then fan out the Gemini calls
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        pages = []
+        text_pages = 0
         for page_num in range(min(len(doc), 20)):  # Limit to 20 pages
             page = doc[page_num]
             
-            # Convert page to image
-            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))  # 2x zoom for better quality
-            img_bytes = pix.tobytes("png")
+            # Pages with a real text layer skip rendering and go to the cheaper text model
+            page_text = page.get_text("text").strip()
+            if len(page_text) > TEXT_PAGE_MIN_CHARS:
+                pages.append((page_num, TEXT_MODEL, [EXTRACTION_PROMPT, page_text]))
+                text_pages += 1
+                continue
             
-            # Send to Gemini Vision
-            try:
-                response = client.models.generate_content(
-                    model="gemini-2.5-flash-preview-05-20",
-                    contents=[
-                        {"inline_data": {"mime_type": "image/png", "data": img_bytes}},
-                        extraction_prompt
-                    ]
-                )
-                
-                # Parse response
-                text = response.text.strip()
-                # Extract JSON from response (handle markdown code blocks)
-                if "```json" in text:
-                    text = text.split("```json")[1].split("```")[0].strip()
-                elif "```" in text:
-                    text = text.split("```")[1].split("```")[0].strip()
-                
-                items = json.loads(text)
-                if isinstance(items, list):
-                    for item in items:
-                        item["page"] = page_num + 1
-                    all_items.extend(items)
-                    print(f"[Catalogue] Page {page_num + 1}: Extracted {len(items)} items")
-                    
-            except json.JSONDecodeError as e:
-                print(f"[Catalogue] Page {page_num + 1}: JSON parse error - {e}")
-            except Exception as e:
-                print(f"[Catalogue] Page {page_num + 1}: Error - {e}")
-        
+            # Convert page to image
+            if CATALOGUE_HIRES:
+                pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
+                img_bytes, mime_type = pix.tobytes("png"), "image/png"
+            else:
+                # Pick the zoom up front so oversized pages never rasterize at full size
+                zoom = min(PAGE_DPI / 72, PAGE_MAX_PX / max(page.rect.width, page.rect.height))
+                pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+                img_bytes, mime_type = pix.tobytes("jpeg", jpg_quality=80), "image/jpeg"
+            pages.append((page_num, VISION_MODEL, [
+                {"inline_data": {"mime_type": mime_type, "data": img_bytes}},
+                EXTRACTION_PROMPT
+            ]))
         doc.close()
+        print(f"[Catalogue] text_pages={text_pages} vision_pages={len(pages) - text_pages}")
+        
+        results = {}
+        with ThreadPoolExecutor(max_workers=CATALOGUE_PARALLEL) as pool:
+            futures = {
+                pool.submit(_extract_page, client, page_num, model, contents): page_num
+                for page_num, model, contents in pages
+            }
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+        
+        # Keep items in page order regardless of which call finished first
+        all_items = []
+        for page_num in sorted(results):
+            all_items.extend(results[page_num])
         return all_items
         
     except ImportError:
@@ -210,7 +411,6 @@ If no items found, return empty array: []
         return []
     except Exception as e:
         print(f"[Catalogue] Error extracting from PDF: {e}")
-        import traceback
         traceback.print_exc()
         return []
 
@@ -225,7 +425,7 @@ def get_catalogue_tools(telegram_id: int) -> list:
         return []
     
     try:
-        drive_service = build('drive', 'v3', credentials=credentials)
+        drive_service = get_service('drive', 'v3', credentials)
     except Exception as e:
         print(f"[Catalogue] Error building Drive service: {e}")
         return []
@@ -277,17 +477,13 @@ def get_catalogue_tools(telegram_id: int) -> list:
             List of catalogue names and details
         """
         try:
-            import sqlite3
-            from bot.config import DATABASE_PATH
-            
-            conn = sqlite3.connect(DATABASE_PATH)
+            conn = _get_conn()
             cursor = conn.cursor()
             cursor.execute(
                 "SELECT id, name, file_type, created_at FROM user_catalogues WHERE telegram_id = ?",
                 (telegram_id,)
             )
             rows = cursor.fetchall()
-            conn.close()
             
             if not rows:
                 return "📂 You don't have any catalogues saved yet.\n\nTo add one, send me a PDF file and say 'Save this as my Products catalogue' (or any name you prefer)."
@@ -320,17 +516,14 @@ def get_catalogue_tools(telegram_id: int) -> list:
             Matching items with details
         """
         try:
-            import sqlite3
-            from bot.config import DATABASE_PATH
-            
-            conn = sqlite3.connect(DATABASE_PATH)
+            conn = _get_conn()
             cursor = conn.cursor()
             
             # Get user's catalogues
             if catalogue_name:
                 cursor.execute(
-                    "SELECT id, name FROM user_catalogues WHERE telegram_id = ? AND name LIKE ?",
-                    (telegram_id, f"%{catalogue_name}%")
+                    "SELECT id, name FROM user_catalogues WHERE telegram_id = ? AND name LIKE ? ESCAPE '\\'",
+                    (telegram_id, f"%{_like_escape(catalogue_name)}%")
                 )
             else:
                 cursor.execute(
@@ -339,38 +532,21 @@ def get_catalogue_tools(telegram_id: int) -> list:
                 )
             
             catalogues = cursor.fetchall()
-            conn.close()
             
             if not catalogues:
                 return "❌ No catalogues found. Upload a PDF catalogue first using 'Save this as my [Name] catalogue'"
             
-            # Search in FAISS indices
-            all_results = []
-            for cat_id, cat_name in catalogues:
-                try:
-                    cat_index = get_catalogue_index(telegram_id, cat_id)
-                    results = cat_index.search(query, n_results=5)
-                    
-                    for r in results:
-                        if r.get("distance", 100) < 1.5:  # Relevance threshold
-                            all_results.append({
-                                "catalogue": cat_name,
-                                "content": r["content"],
-                                "metadata": r["metadata"],
-                                "distance": r["distance"]
-                            })
-                except Exception as e:
-                    print(f"[Catalogue] Error searching catalogue {cat_id}: {e}")
+            # One index holds all of the user's catalogues; filter to the ones matched above
+            names = dict(catalogues)
+            cat_index = get_catalogue_index(telegram_id)
+            all_results = cat_index.search(query, n_results=10, catalogue_ids=list(names))
             
             if not all_results:
                 return f"❌ No items found matching '{query}' in your catalogues."
             
-            # Sort by relevance
-            all_results.sort(key=lambda x: x['distance'])
-            
             output = f"🔍 Found {len(all_results)} item(s) matching '{query}':\n\n"
-            for result in all_results[:10]:  # Limit to top 10
-                meta = result['metadata']
+            for result in all_results:  # Already best-first, top 10
+                meta = result.metadata
                 output += f"📦 {meta.get('name', 'Unknown Item')}\n"
                 if meta.get('item_code'):
                     output += f"   Code: {meta['item_code']}\n"
@@ -378,7 +554,7 @@ def get_catalogue_tools(telegram_id: int) -> list:
                     output += f"   Price: ${meta['price']}\n"
                 if meta.get('description'):
                     output += f"   {meta['description'][:100]}\n"
-                output += f"   (from: {result['catalogue']})\n\n"
+                output += f"   (from: {names.get(meta.get('catalogue_id'), 'Unknown')})\n\n"
             
             return output.strip()
             
@@ -397,21 +573,17 @@ def get_catalogue_tools(telegram_id: int) -> list:
             Success or error message
         """
         try:
-            import sqlite3
-            from bot.config import DATABASE_PATH
-            
-            conn = sqlite3.connect(DATABASE_PATH)
+            conn = _get_conn()
             cursor = conn.cursor()
             
             # Find the catalogue
             cursor.execute(
-                "SELECT id, drive_file_id FROM user_catalogues WHERE telegram_id = ? AND name LIKE ?",
-                (telegram_id, f"%{catalogue_name}%")
+                "SELECT id, drive_file_id FROM user_catalogues WHERE telegram_id = ? AND name LIKE ? ESCAPE '\\'",
+                (telegram_id, f"%{_like_escape(catalogue_name)}%")
             )
             row = cursor.fetchone()
             
             if not row:
-                conn.close()
                 return f"❌ Catalogue '{catalogue_name}' not found."
             
             cat_id, drive_file_id = row
@@ -423,17 +595,16 @@ def get_catalogue_tools(telegram_id: int) -> list:
                 except Exception as e:
                     print(f"[Catalogue] Error deleting from Drive: {e}")
             
-            # Delete FAISS index
+            # Remove its items from the user's FAISS index
             try:
-                cat_index = get_catalogue_index(telegram_id, cat_id)
-                cat_index.clear()
+                cat_index = get_catalogue_index(telegram_id)
+                cat_index.remove_catalogue(cat_id)
             except Exception as e:
                 print(f"[Catalogue] Error deleting index: {e}")
             
             # Delete from database
-            cursor.execute("DELETE FROM user_catalogues WHERE id = ?", (cat_id,))
-            conn.commit()
-            conn.close()
+            with conn:
+                conn.execute("DELETE FROM user_catalogues WHERE id = ?", (cat_id,))
             
             return f"✅ Catalogue '{catalogue_name}' deleted successfully."
             
@@ -443,6 +614,56 @@ def get_catalogue_tools(telegram_id: int) -> list:
     return [save_catalogue, list_catalogues, search_catalogue, delete_catalogue]
 
 
+# Set once ux_user_cat (the UPSERT's conflict target) is known to exist; only a positive
+# answer is remembered, so duplicates cleaned up later let the bot switch over
+_catalogue_index_ready = False
+
+
+def _ensure_catalogue_index(conn: sqlite3.Connection) -> bool:
+    """Create ux_user_cat from the bot side if needed; False while duplicate names block it."""
+    global _catalogue_index_ready
+    if not _catalogue_index_ready:
+        try:
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_user_cat ON user_catalogues (telegram_id, name)")
+            _catalogue_index_ready = True
+        except sqlite3.IntegrityError:
+            print("[Catalogue] Duplicate catalogue names exist; saving without UPSERT")
+    return _catalogue_index_ready
+
+
+def _upsert_catalogue(telegram_id: int, name: str, drive_file_id: str) -> int:
+    """Insert or update a PDF catalogue row (one statement when the unique index exists); returns its id."""
+    with _get_conn() as conn:
+        if _ensure_catalogue_index(conn):
+            row = conn.execute("""
+                INSERT INTO user_catalogues (telegram_id, name, file_type, drive_file_id, created_at)
+                VALUES (?, ?, 'pdf', ?, datetime('now'))
+                ON CONFLICT (telegram_id, name) DO UPDATE
+                    SET drive_file_id = excluded.drive_file_id, updated_at = datetime('now')
+                RETURNING id
+            """, (telegram_id, name, drive_file_id)).fetchone()
+            return row[0]
+        
+        # Check if catalogue with same name exists
+        existing = conn.execute(
+            "SELECT id FROM user_catalogues WHERE telegram_id = ? AND name = ? ORDER BY id LIMIT 1",
+            (telegram_id, name)
+        ).fetchone()
+        if existing:
+            conn.execute("""
+                UPDATE user_catalogues 
+                SET drive_file_id = ?, updated_at = datetime('now')
+                WHERE id = ?
+            """, (drive_file_id, existing[0]))
+            return existing[0]
+        
+        cursor = conn.execute("""
+            INSERT INTO user_catalogues (telegram_id, name, file_type, drive_file_id, created_at)
+            VALUES (?, ?, 'pdf', ?, datetime('now'))
+        """, (telegram_id, name, drive_file_id))
+        return cursor.lastrowid
+
+
 def save_catalogue_from_pdf(
     telegram_id: int,
     pdf_bytes: bytes,
@@ -458,23 +679,18 @@ def save_catalogue_from_pdf(
         (success: bool, message: str)
     """
     try:
-        import sqlite3
-        from bot.config import DATABASE_PATH
-        from googleapiclient.discovery import build
-        from googleapiclient.http import MediaIoBaseUpload
-        
         credentials = get_credentials(telegram_id)
         if not credentials:
             return False, "❌ Please connect your Google account first with /register_google"
         
-        drive_service = build('drive', 'v3', credentials=credentials)
+        drive_service = get_service('drive', 'v3', credentials)
         
         # Handle folder creation if requested
         folder_id = None
         if folder_name:
             # Check if folder exists
-            query = f"name = '{folder_name}' and mimeType = 'application/vnd.google-apps.folder' and trashed = false"
-            results = drive_service.files().list(q=query, fields="files(id, name)").execute()
+            query = f"name = '{drive_quote(folder_name)}' and mimeType = 'application/vnd.google-apps.folder' and trashed = false"
+            results = drive_service.files().list(q=query, spaces='drive', pageSize=1, fields="files(id)").execute()
             folders = results.get('files', [])
             
             if folders:
@@ -505,10 +721,14 @@ def save_catalogue_from_pdf(
         if folder_id:
             file_metadata['parents'] = [folder_id]
         
+        # BytesIO shares pdf_bytes' buffer, so this doesn't copy the PDF. Small files go up
+        # in one multipart request, skipping the extra round trip to open a resumable session.
+        resumable = len(pdf_bytes) >= RESUMABLE_UPLOAD_MIN
         media = MediaIoBaseUpload(
             io.BytesIO(pdf_bytes),
             mimetype='application/pdf',
-            resumable=True
+            chunksize=UPLOAD_CHUNK_SIZE,
+            resumable=resumable
         )
         
         file = drive_service.files().create(
@@ -527,50 +747,16 @@ def save_catalogue_from_pdf(
         
         if not items:
             # Still save reference even if no items extracted
-            conn = sqlite3.connect(DATABASE_PATH)
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO user_catalogues (telegram_id, name, file_type, drive_file_id, created_at)
-                VALUES (?, ?, 'pdf', ?, datetime('now'))
-            """, (telegram_id, catalogue_name, drive_file_id))
-            conn.commit()
-            conn.close()
+            _upsert_catalogue(telegram_id, catalogue_name, drive_file_id)
             
             return True, f"📁 Catalogue '{catalogue_name}' saved to Drive.\n\n⚠️ Could not extract items automatically. You may need to upload a clearer PDF or a Google Sheet instead."
         
-        # Step 3: Save to database
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        
-        # Check if catalogue with same name exists
-        cursor.execute(
-            "SELECT id FROM user_catalogues WHERE telegram_id = ? AND name = ?",
-            (telegram_id, catalogue_name)
-        )
-        existing = cursor.fetchone()
-        
-        if existing:
-            # Update existing
-            catalogue_id = existing[0]
-            cursor.execute("""
-                UPDATE user_catalogues 
-                SET drive_file_id = ?, updated_at = datetime('now')
-                WHERE id = ?
-            """, (drive_file_id, catalogue_id))
-        else:
-            # Create new
-            cursor.execute("""
-                INSERT INTO user_catalogues (telegram_id, name, file_type, drive_file_id, created_at)
-                VALUES (?, ?, 'pdf', ?, datetime('now'))
-            """, (telegram_id, catalogue_name, drive_file_id))
-            catalogue_id = cursor.lastrowid
-        
-        conn.commit()
-        conn.close()
+        # Step 3: Save to database (re-saving a name updates the existing catalogue)
+        catalogue_id = _upsert_catalogue(telegram_id, catalogue_name, drive_file_id)
         
         # Step 4: Index items to FAISS
         print(f"[Catalogue] Indexing {len(items)} items to FAISS...")
-        cat_index = get_catalogue_index(telegram_id, catalogue_id)
+        cat_index = get_catalogue_index(telegram_id)
         
         # Prepare items with proper format
         indexed_items = []
@@ -585,13 +771,14 @@ def save_catalogue_from_pdf(
             })
         
         # Add to FAISS index
-        cat_index.add_items(indexed_items)
+        indexed = cat_index.add_items(indexed_items, catalogue_id, catalogue_name)
         
-        print(f"[Catalogue] Indexed {len(items)} items successfully")
+        print(f"[Catalogue] Indexed {indexed} of {len(items)} items")
+        if not indexed:
+            return True, f"📁 Catalogue '{catalogue_name}' saved to Drive.\n\n⚠️ Extracted {len(items)} items but could not index them for search. Please try saving it again."
         
         return True, f"✅ Catalogue '{catalogue_name}' saved!\n\n📊 Extracted {len(items)} items from {original_filename}\n📁 Uploaded to Google Drive\n🔍 Ready for search\n\nTry: 'Search catalogue for [item name]'"
         
     except Exception as e:
-        import traceback
         traceback.print_exc()
         return False, f"❌ Error saving catalogue: {str(e)}"
@@ -7,18 +7,266 @@ import os
 import io
 import re
 import tempfile
-from datetime import datetime, timedelta, timezone
-from typing import Optional, List, Dict, Any
+import time
+import threading
+from functools import lru_cache
+from itertools import count
+from typing import Optional, List
+from cachetools import TTLCache
 from langchain_core.tools import tool
+from pydantic import BaseModel, Field
 
-# Malaysia timezone
-MYT = timezone(timedelta(hours=8))
+# Persist matplotlib's font cache in the data volume so it isn't rebuilt on every container start.
+# Must be set before matplotlib is imported.
+os.environ.setdefault('MPLCONFIGDIR', '/app/data/.mplcache')
+try:
+    os.makedirs(os.environ['MPLCONFIGDIR'], exist_ok=True)
+except OSError:
+    pass  # matplotlib falls back to a temp dir
+
+try:
+    import matplotlib
+    matplotlib.use('Agg')  # Non-interactive backend for server
+    import matplotlib.pyplot as plt
+    
+    # Style and figure are set up once; each chart clears and redraws the shared figure
+    plt.style.use('seaborn-v0_8-whitegrid')
+    # Constrained layout is solved during the normal draw, so savefig doesn't need a
+    # second bbox_inches='tight' pass; both settings survive clf()
+    _FIG = plt.figure(figsize=(10, 6), layout='constrained')
+    _FIG.patch.set_facecolor('white')
+    _FIG_LOCK = threading.Lock()
+    MATPLOTLIB_AVAILABLE = True
+except ImportError:
+    MATPLOTLIB_AVAILABLE = False
+
+# Chart ids: nanosecond timestamp plus a process-wide sequence number for uniqueness
+_CHART_SEQ = count()
+
+# 100 DPI at 10x6" is plenty for Telegram; callers can ask for more up to CHART_MAX_DPI
+CHART_DPI = 100
+CHART_MAX_DPI = 300
+
+# Output format: png (matplotlib encoder), or jpeg/webp encoded by Pillow from the Agg buffer
+CHART_FORMAT = os.getenv("CHART_FORMAT", "png").lower()
+if CHART_FORMAT == "jpg":
+    CHART_FORMAT = "jpeg"
+if CHART_FORMAT not in ("png", "jpeg", "webp"):
+    print(f"[Charts] Unknown CHART_FORMAT '{CHART_FORMAT}', using png")
+    CHART_FORMAT = "png"
+CHART_QUALITY = 85
+
+# Color scheme - professional blues; ax.pie cycles _COLORS itself
+PRIMARY_COLOR = '#2E86AB'
+SECONDARY_COLOR = '#A23B72'
+_COLORS = ('#2E86AB', '#F18F01', '#C73E1D', '#3B1F2B', '#95C623', '#5D4E6D')
+# Beyond this many slices the explode gap is invisible, so it's skipped
+PIE_EXPLODE_MAX = 10
+
+
+@lru_cache(maxsize=16)
+def _explode(n: int) -> tuple:
+    return (0.02,) * n
+
+
+# Metrics formatted as currency in analyze_data
+_MONEY_METRICS = frozenset(('sales', 'revenue', 'amount'))
+# Below this many points analyze_data sticks to plain Python
+NUMPY_MIN_POINTS = 64
+
+# Charts stay in memory until sent (CHART_FILE:mem:<id>); CHARTS_TO_DISK=1 writes
+# PNGs under /app/data/charts and returns their paths as before
+CHARTS_TO_DISK = os.getenv("CHARTS_TO_DISK", "0") == "1"
+_chart_buffers = TTLCache(maxsize=64, ttl=600)
+_chart_buffers_lock = threading.Lock()
 
 
-def get_chart_tools() -> list:
+def pop_chart(chart_id: str) -> Optional[bytes]:
+    """Take a rendered chart's image bytes; None if unknown or expired."""
+    with _chart_buffers_lock:
+        return _chart_buffers.pop(chart_id, None)
+
+
+def _save_chart(fp, dpi):
+    """Write the shared figure to a path or file object in CHART_FORMAT."""
+    if CHART_FORMAT == "png":
+        _FIG.savefig(fp, format='png', dpi=dpi)
+        return
+    
+    from PIL import Image
+    _FIG.set_dpi(dpi)
+    _FIG.canvas.draw()
+    rgba = _FIG.canvas.buffer_rgba()
+    height, width = rgba.shape[:2]
+    img = Image.frombuffer('RGBA', (width, height), rgba, 'raw', 'RGBA', 0, 1).convert('RGB')
+    if CHART_FORMAT == "webp":
+        img.save(fp, 'WEBP', quality=CHART_QUALITY, method=4)
+    else:
+        img.save(fp, 'JPEG', quality=CHART_QUALITY, optimize=True)
+
+
+# What the shared figure currently shows: (chart_type, n) plus its axes and data artists.
+# A single-series bar/hbar/line chart of the same shape only swaps data into those artists,
+# keeping the axes, grid and tick styling from the previous draw.
+_warm = {"key": None, "ax": None, "artists": None}
+
+
+def _update_warm(chart_type, ax, artists, labels, values):
+    """Swap new data into the artists of the previous same-shaped chart."""
+    positions = range(len(values))
+    if chart_type == "bar":
+        for rect, v in zip(artists, values):
+            rect.set_height(v)
+        ax.set_xticks(positions, labels)
+        plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
+    elif chart_type == "hbar":
+        for rect, v in zip(artists, values):
+            rect.set_width(v)
+        ax.set_yticks(positions, labels)
+    else:
+        artists.set_ydata(values)
+        ax.set_xticks(positions, labels)
+        plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
+    ax.relim()
+    ax.autoscale_view()
+
+
+def _render_bar(ax, labels, values, y_label, comparison_values, comparison_label):
+    if comparison_values:
+        # Grouped bar chart
+        import numpy as np
+        x = np.arange(len(labels), dtype=np.float64)
+        width = 0.35
+        half = width * 0.5
+        ax.bar(x - half, values, width, label=y_label or 'Current', color=PRIMARY_COLOR)
+        ax.bar(x + half, comparison_values, width, label=comparison_label, color=SECONDARY_COLOR)
+        ax.set_xticks(x)
+        ax.set_xticklabels(labels, rotation=45, ha='right')
+        ax.legend()
+        return None
+    
+    positions = range(len(values))
+    bars = ax.bar(positions, values, color=PRIMARY_COLOR)
+    ax.set_xticks(positions, labels)
+    plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
+    return bars
+
+
+def _render_hbar(ax, labels, values, y_label, comparison_values, comparison_label):
+    positions = range(len(values))
+    bars = ax.barh(positions, values, color=PRIMARY_COLOR)
+    ax.set_yticks(positions, labels)
+    return bars
+
+
+def _render_line(ax, labels, values, y_label, comparison_values, comparison_label):
+    line = None
+    if comparison_values:
+        ax.plot(labels, values, marker='o', linewidth=2, markersize=8, color=PRIMARY_COLOR)
+        ax.plot(labels, comparison_values, marker='s', linewidth=2, markersize=8, 
+               color=SECONDARY_COLOR, label=comparison_label)
+        ax.legend()
+    else:
+        positions = range(len(values))
+        line, = ax.plot(positions, values, marker='o', linewidth=2, markersize=8, color=PRIMARY_COLOR)
+        ax.set_xticks(positions, labels)
+    plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
+    return line
+
+
+def _render_pie(ax, labels, values, y_label, comparison_values, comparison_label):
+    n = len(values)
+    ax.pie(values, labels=labels, autopct='%1.1f%%', colors=_COLORS,
+          startangle=90, explode=_explode(n) if n <= PIE_EXPLODE_MAX else None)
+    ax.axis('equal')
+    return None
+
+
+# Each renderer draws onto a fresh axes and returns the artists the warm path can update, or None.
+# Single-series charts are plotted at integer positions (as categorical axes would) so those
+# artists can later take new data in place.
+_RENDERERS = {
+    'bar': _render_bar,
+    'hbar': _render_hbar,
+    'line': _render_line,
+    'pie': _render_pie,
+}
+
+
+def _draw_chart(chart_type, labels, values, title, x_label, y_label,
+                comparison_values, comparison_label, dpi=CHART_DPI) -> str:
+    """Draw into the shared figure and save it; callers must hold _FIG_LOCK."""
+    try:
+        chart_type = chart_type.strip().lower()
+        renderer = _RENDERERS.get(chart_type)
+        if renderer is None:
+            return f"❌ Unknown chart type: {chart_type}. Use 'bar', 'line', 'pie', or 'hbar'."
+        
+        key = (chart_type, len(values)) if chart_type != "pie" and not comparison_values else None
+        
+        if key is not None and key == _warm["key"]:
+            ax = _warm["ax"]
+            _update_warm(chart_type, ax, _warm["artists"], labels, values)
+        else:
+            _warm["key"] = None
+            # clf() resets axes state (pie changes aspect and frame) without building a new figure
+            _FIG.clf()
+            ax = _FIG.add_subplot()
+            artists = renderer(ax, labels, values, y_label, comparison_values, comparison_label)
+            _warm.update(key=key, ax=ax, artists=artists)
+        
+        ax.set_title(title, fontsize=14, fontweight='bold', pad=20)
+        # Set unconditionally so a reused axes doesn't keep the previous chart's labels
+        if chart_type not in ['pie', 'hbar']:
+            ax.set_xlabel(x_label)
+        if chart_type != 'pie':
+            ax.set_ylabel(y_label)
+        
+        ext = "jpg" if CHART_FORMAT == "jpeg" else CHART_FORMAT
+        chart_id = f"chart_{time.time_ns()}_{next(_CHART_SEQ):04x}.{ext}"
+        
+        if CHARTS_TO_DISK:
+            # Save to file
+            chart_dir = "/app/data/charts"
+            os.makedirs(chart_dir, exist_ok=True)
+            filepath = os.path.join(chart_dir, chart_id)
+            # 1 MiB buffer: the encoder's small chunked writes become one or two write() calls
+            with open(filepath, 'wb', buffering=1 << 20) as f:
+                _save_chart(f, dpi)
+            return f"CHART_FILE:{filepath}"
+        
+        # Render to memory; the Telegram sender picks the bytes up by id
+        buf = io.BytesIO()
+        _save_chart(buf, dpi)
+        with _chart_buffers_lock:
+            _chart_buffers[chart_id] = buf.getvalue()
+        
+        return f"CHART_FILE:mem:{chart_id}"
+        
+    except Exception as e:
+        _warm["key"] = None
+        return f"❌ Error generating chart: {str(e)}"
+
+
+class ChartSpec(BaseModel):
+    """One chart in a generate_charts call; the fields mirror generate_chart's arguments."""
+    chart_type: str = Field(description='Type of chart - "bar", "line", "pie", "hbar" (horizontal bar)')
+    labels: List[str] = Field(description="Labels for x-axis (bar/line) or segments (pie)")
+    values: List[float] = Field(description="Numeric values to plot")
+    title: str = Field(description="Chart title")
+    x_label: str = Field("", description="Label for x-axis (optional)")
+    y_label: str = Field("", description="Label for y-axis (optional)")
+    comparison_values: Optional[List[float]] = Field(None, description="Second set of values for grouped bar comparison (optional)")
+    comparison_label: str = Field("Comparison", description="Label for comparison data series (optional)")
+    dpi: int = Field(CHART_DPI, description="Image resolution (optional; only raise it when a sharper image is requested)")
+
+
+@lru_cache(maxsize=1)
+def get_chart_tools() -> tuple:
     """
     Create chart generation tools.
-    These tools don't require user credentials - they're pure computation.
+    These tools don't require user credentials - they're pure computation,
+    so they are built once and shared.
     """
     
     @tool
@@ -30,7 +278,8 @@ def get_chart_tools() -> list:
         x_label: str = "",
         y_label: str = "",
         comparison_values: Optional[List[float]] = None,
-        comparison_label: str = "Comparison"
+        comparison_label: str = "Comparison",
+        dpi: int = CHART_DPI
     ) -> str:
         """
         Generate a chart image and save it for sending to the user.
@@ -44,86 +293,50 @@ def get_chart_tools() -> list:
             y_label: Label for y-axis (optional)  
             comparison_values: Second set of values for grouped bar comparison (optional)
             comparison_label: Label for comparison data series (optional)
+            dpi: Image resolution (optional, default 100; only raise it when a sharper image is requested)
         
         Returns:
             Path to the generated chart image file
         """
-        try:
-            import matplotlib
-            matplotlib.use('Agg')  # Non-interactive backend for server
-            import matplotlib.pyplot as plt
-            
-            # Create figure with professional styling
-            plt.style.use('seaborn-v0_8-whitegrid')
-            fig, ax = plt.subplots(figsize=(10, 6))
-            
-            # Color scheme - professional blues
-            primary_color = '#2E86AB'
-            secondary_color = '#A23B72'
-            colors = ['#2E86AB', '#F18F01', '#C73E1D', '#3B1F2B', '#95C623', '#5D4E6D']
-            
-            chart_type = chart_type.lower().strip()
-            
-            if chart_type == "bar":
-                if comparison_values:
-                    # Grouped bar chart
-                    x = range(len(labels))
-                    width = 0.35
-                    ax.bar([i - width/2 for i in x], values, width, label=y_label or 'Current', color=primary_color)
-                    ax.bar([i + width/2 for i in x], comparison_values, width, label=comparison_label, color=secondary_color)
-                    ax.set_xticks(x)
-                    ax.set_xticklabels(labels, rotation=45, ha='right')
-                    ax.legend()
-                else:
-                    ax.bar(labels, values, color=primary_color)
-                    plt.xticks(rotation=45, ha='right')
-                    
-            elif chart_type == "hbar":
-                ax.barh(labels, values, color=primary_color)
-                
-            elif chart_type == "line":
-                ax.plot(labels, values, marker='o', linewidth=2, markersize=8, color=primary_color)
-                if comparison_values:
-                    ax.plot(labels, comparison_values, marker='s', linewidth=2, markersize=8, 
-                           color=secondary_color, label=comparison_label)
-                    ax.legend()
-                plt.xticks(rotation=45, ha='right')
-                
-            elif chart_type == "pie":
-                ax.pie(values, labels=labels, autopct='%1.1f%%', colors=colors[:len(values)],
-                      startangle=90, explode=[0.02] * len(values))
-                ax.axis('equal')
-                
-            else:
-                return f"❌ Unknown chart type: {chart_type}. Use 'bar', 'line', 'pie', or 'hbar'."
-            
-            ax.set_title(title, fontsize=14, fontweight='bold', pad=20)
-            if x_label and chart_type not in ['pie', 'hbar']:
-                ax.set_xlabel(x_label)
-            if y_label and chart_type != 'pie':
-                ax.set_ylabel(y_label)
-            
-            plt.tight_layout()
-            
-            # Save to temp file
-            chart_dir = "/app/data/charts"
-            os.makedirs(chart_dir, exist_ok=True)
-            
-            import uuid
-            timestamp = datetime.now(MYT).strftime("%Y%m%d_%H%M%S")
-            unique_id = str(uuid.uuid4())[:8]
-            filename = f"chart_{timestamp}_{unique_id}.png"
-            filepath = os.path.join(chart_dir, filename)
-            
-            plt.savefig(filepath, dpi=150, bbox_inches='tight', facecolor='white')
-            plt.close(fig)
-            
-            return f"CHART_FILE:{filepath}"
-            
-        except ImportError:
+        if not MATPLOTLIB_AVAILABLE:
             return "❌ matplotlib not installed. Please add matplotlib to requirements.txt"
-        except Exception as e:
-            return f"❌ Error generating chart: {str(e)}"
+        
+        with _FIG_LOCK:
+            return _draw_chart(chart_type, labels, values, title, x_label, y_label,
+                               comparison_values, comparison_label,
+                               max(50, min(int(dpi or CHART_DPI), CHART_MAX_DPI)))
+    
+    @tool
+    def generate_charts(specs: List[ChartSpec]) -> str:
+        """
+        Generate several charts in one call (e.g. a dashboard of KPIs).
+        Prefer this over calling generate_chart repeatedly.
+        
+        Args:
+            specs: One entry per chart, with the same fields as generate_chart's arguments
+        
+        Returns:
+            One result line per chart, in order
+        """
+        if not MATPLOTLIB_AVAILABLE:
+            return "❌ matplotlib not installed. Please add matplotlib to requirements.txt"
+        if not specs:
+            return "❌ No charts requested."
+        
+        results = []
+        # One lock hold for the whole batch; same-shaped charts reuse the warm axes
+        with _FIG_LOCK:
+            for spec in specs:
+                try:
+                    results.append(_draw_chart(
+                        spec.chart_type, spec.labels, spec.values, spec.title,
+                        spec.x_label, spec.y_label,
+                        spec.comparison_values, spec.comparison_label,
+                        max(50, min(int(spec.dpi or CHART_DPI), CHART_MAX_DPI))
+                    ))
+                except (TypeError, ValueError) as e:
+                    results.append(f"❌ Invalid chart spec: {str(e)}")
+        return "\n".join(results)
     
     @tool
     def analyze_data(
@@ -149,32 +362,48 @@ def get_chart_tools() -> list:
             if not values:
                 return "❌ No data to analyze."
             
-            total = sum(values)
-            avg = total / len(values)
-            max_val = max(values)
-            min_val = min(values)
+            n = len(values)
+            half = n // 2
+            has_comparison = bool(comparison_values) and len(comparison_values) == n
+            if n <= NUMPY_MIN_POINTS:
+                # Chat-sized data: plain Python beats importing numpy and building an array
+                total = float(sum(values))
+                max_idx = max(range(n), key=values.__getitem__)
+                max_val = float(values[max_idx])
+                first_half = float(sum(values[:half]))
+                prev_total = float(sum(comparison_values)) if has_comparison else 0.0
+            else:
+                import numpy as np
+                
+                # One array, reductions in C instead of repeated Python scans
+                arr = np.asarray(values, dtype=np.float64)
+                total = float(arr.sum())
+                max_idx = int(arr.argmax())
+                max_val = float(arr[max_idx])
+                first_half = float(arr[:half].sum())
+                prev_total = float(np.sum(comparison_values, dtype=np.float64)) if has_comparison else 0.0
+            avg = total / n
             
-            insights = []
-            insights.append(f"Total {metric_name}: ${total:,.2f}" if metric_name in ['sales', 'revenue', 'amount'] else f"Total: {total:,.2f}")
-            insights.append(f"Average: ${avg:,.2f}" if metric_name in ['sales', 'revenue', 'amount'] else f"Average: {avg:,.2f}")
+            if metric_name in _MONEY_METRICS:
+                insights = [f"Total {metric_name}: ${total:,.2f}", f"Average: ${avg:,.2f}"]
+                top = f"${max_val:,.2f}"
+            else:
+                insights = [f"Total: {total:,.2f}", f"Average: {avg:,.2f}"]
+                top = f"{max_val:,.2f}"
             
             # Find top performer
-            if labels and len(labels) == len(values):
-                max_idx = values.index(max_val)
-                insights.append(f"Top: {labels[max_idx]} (${max_val:,.2f})" if metric_name in ['sales', 'revenue', 'amount'] else f"Top: {labels[max_idx]} ({max_val:,.2f})")
+            if labels and len(labels) == n:
+                insights.append(f"Top: {labels[max_idx]} ({top})")
             
             # Comparison analysis
-            if comparison_values and len(comparison_values) == len(values):
-                prev_total = sum(comparison_values)
-                if prev_total > 0:
-                    change_pct = ((total - prev_total) / prev_total) * 100
-                    direction = "up" if change_pct > 0 else "down"
-                    insights.append(f"Change: {direction} {abs(change_pct):.1f}% from previous period")
+            if has_comparison and prev_total > 0:
+                change_pct = ((total - prev_total) / prev_total) * 100
+                direction = "up" if change_pct > 0 else "down"
+                insights.append(f"Change: {direction} {abs(change_pct):.1f}% from previous period")
             
             # Trend analysis (if enough data points)
-            if len(values) >= 3:
-                first_half = sum(values[:len(values)//2])
-                second_half = sum(values[len(values)//2:])
+            if n >= 3:
+                second_half = total - first_half
                 if second_half > first_half * 1.1:
                     insights.append("Trend: Upward momentum in recent period")
                 elif second_half < first_half * 0.9:
@@ -187,4 +416,4 @@ def get_chart_tools() -> list:
         except Exception as e:
             return f"❌ Error analyzing data: {str(e)}"
     
-    return [generate_chart, analyze_data]
+    return (generate_chart, generate_charts, analyze_data)
@@ -4,11 +4,15 @@ Handles per-user Google OAuth flow and token management.
 """
 import os
 import json
-from datetime import datetime, timezone
-from typing import Optional, Tuple
+import hashlib
+import threading
+from functools import lru_cache
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional, Set, Tuple
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
 from google.auth.transport.requests import Request
+from cachetools import LRUCache, TTLCache
 import sqlite3
 
 # OAuth Scopes for Google Services
@@ -32,47 +36,126 @@ GOOGLE_REDIRECT_URI = os.getenv('GOOGLE_REDIRECT_URI')
 DATABASE_PATH = os.getenv('DATABASE_PATH', '/app/data/bot.db')
 
 
-def get_db():
-    """Get database connection"""
-    return sqlite3.connect(DATABASE_PATH)
+# One shared autocommit connection; _DB_LOCK serialises access across threads
+_CONN: Optional[sqlite3.Connection] = None
+_DB_LOCK = threading.Lock()
+
+# Live credentials per user as (credentials, created_at of the stored row), served until shortly
+# before the access token expires. The OAuth callback runs in the admin process, so a cached
+# entry is checked against the row's created_at (rewritten on every re-link) before use.
+_CRED_CACHE = TTLCache(maxsize=10_000, ttl=3600)
+_CRED_LOCK = threading.Lock()
+_REFRESH_LOCKS = LRUCache(maxsize=10_000)
+# Users recently found without a Google link; the connection check tool is called before
+# every Google operation, so this spares unlinked users a DB read each time. exchange_code clears
+# it in the process that handles the OAuth callback (the admin API); the bot process can still
+# read a fresh link as "not linked" for up to 30s, so commands the user runs explicitly pass
+# use_cache=False.
+_NOT_LINKED = TTLCache(maxsize=10_000, ttl=30)
+CRED_CACHE_MARGIN = timedelta(seconds=60)
+
+# API clients keyed by (api, version, credentials fingerprint); a refreshed token yields a new key.
+# Built tool lists hold on to these and turns run on a thread pool, so a service can be used by
+# several threads at once - its transport therefore hands each thread its own httplib2.Http.
+_SERVICES = LRUCache(maxsize=1024)
+_SERVICES_LOCK = threading.Lock()
+
+
+class _PerThreadHttp:
+    """Stand-in for httplib2.Http that forwards to a separate Http per thread (Http isn't thread-safe)"""
+    
+    def __init__(self):
+        self._local = threading.local()
+    
+    def _http(self):
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            from googleapiclient.http import build_http
+            http = self._local.http = build_http()
+        return http
+    
+    def request(self, *args, **kwargs):
+        return self._http().request(*args, **kwargs)
+    
+    def __getattr__(self, name):
+        return getattr(self._http(), name)
+
+
+_THREAD_HTTP = _PerThreadHttp()
+
+
+def get_db() -> sqlite3.Connection:
+    """Get the shared database connection (callers must hold _DB_LOCK)"""
+    global _CONN
+    if _CONN is None:
+        conn = sqlite3.connect(DATABASE_PATH, check_same_thread=False, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        # Schema is ensured on first use rather than at import
+        _init_schema(conn)
+        _CONN = conn
+    return _CONN
 
 
 def init_google_tokens_table():
     """Initialize the google_tokens table if it doesn't exist"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''
+    with _DB_LOCK:
+        get_db()
+
+
+def _init_schema(conn: sqlite3.Connection):
+    """Create google_tokens and apply column migrations"""
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS google_tokens (
             telegram_id INTEGER PRIMARY KEY,
             access_token TEXT NOT NULL,
             refresh_token TEXT NOT NULL,
             token_expiry TEXT NOT NULL,
+            token_expiry_epoch INTEGER,
             scopes TEXT NOT NULL,
             created_at TEXT NOT NULL
         )
     ''')
-    conn.commit()
-    conn.close()
+    # Expiry as epoch seconds, so reads skip ISO parsing; older tables are backfilled once
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(google_tokens)')}
+    if 'token_expiry_epoch' not in columns:
+        conn.execute('ALTER TABLE google_tokens ADD COLUMN token_expiry_epoch INTEGER')
+        conn.execute(
+            "UPDATE google_tokens SET token_expiry_epoch = CAST(strftime('%s', token_expiry) AS INTEGER) "
+            "WHERE token_expiry IS NOT NULL AND token_expiry != ''"
+        )
+    
+    # Scopes are stored pipe-joined; convert rows still holding a JSON list
+    for telegram_id, scopes_json in conn.execute("SELECT telegram_id, scopes FROM google_tokens WHERE scopes LIKE '[%'").fetchall():
+        try:
+            scopes = '|'.join(json.loads(scopes_json))
+        except ValueError:
+            scopes = '|'.join(SCOPES)
+        conn.execute('UPDATE google_tokens SET scopes = ? WHERE telegram_id = ?', (scopes, telegram_id))
+
+
+def _expiry_epoch(credentials: Credentials) -> Optional[int]:
+    """Credentials expiry (naive UTC) as epoch seconds"""
+    if not credentials.expiry:
+        return None
+    return int(credentials.expiry.replace(tzinfo=timezone.utc).timestamp())
+
+
+# Built once from the environment; only the Flow (which carries per-request state) is created per call
+_CLIENT_CONFIG = {
+    "web": {
+        "client_id": GOOGLE_CLIENT_ID,
+        "client_secret": GOOGLE_CLIENT_SECRET,
+        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+        "token_uri": "https://oauth2.googleapis.com/token",
+        "redirect_uris": [GOOGLE_REDIRECT_URI],
+    }
+}
 
 
 def get_oauth_flow() -> Flow:
     """Create OAuth flow with client credentials"""
-    client_config = {
-        "web": {
-            "client_id": GOOGLE_CLIENT_ID,
-            "client_secret": GOOGLE_CLIENT_SECRET,
-            "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-            "token_uri": "https://oauth2.googleapis.com/token",
-            "redirect_uris": [GOOGLE_REDIRECT_URI],
-        }
-    }
-    
-    flow = Flow.from_client_config(
-        client_config,
-        scopes=SCOPES,
-        redirect_uri=GOOGLE_REDIRECT_URI
-    )
-    return flow
+    return Flow.from_client_config(_CLIENT_CONFIG, scopes=SCOPES, redirect_uri=GOOGLE_REDIRECT_URI)
 
 
 def get_auth_url(telegram_id: int) -> str:
@@ -114,26 +197,25 @@ def exchange_code(code: str, state: str) -> Tuple[bool, str, Optional[int]]:
         
         credentials = flow.credentials
         
-        # Store tokens in database
-        conn = get_db()
-        cursor = conn.cursor()
-        
-        # Upsert token
-        cursor.execute('''
-            INSERT OR REPLACE INTO google_tokens 
-            (telegram_id, access_token, refresh_token, token_expiry, scopes, created_at)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (
-            telegram_id,
-            credentials.token,
-            credentials.refresh_token,
-            credentials.expiry.isoformat() if credentials.expiry else None,
-            json.dumps(list(credentials.scopes)) if credentials.scopes else json.dumps(SCOPES),
-            datetime.now(timezone.utc).isoformat()
-        ))
-        
-        conn.commit()
-        conn.close()
+        # Store tokens in database (upsert)
+        with _DB_LOCK:
+            get_db().execute('''
+                INSERT OR REPLACE INTO google_tokens 
+                (telegram_id, access_token, refresh_token, token_expiry, token_expiry_epoch, scopes, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                telegram_id,
+                credentials.token,
+                credentials.refresh_token,
+                credentials.expiry.isoformat() if credentials.expiry else None,
+                _expiry_epoch(credentials),
+                '|'.join(credentials.scopes or SCOPES),
+                datetime.now(timezone.utc).isoformat()
+            ))
+        # Same-process callers (the admin's /api/google/status) see the link at once
+        with _CRED_LOCK:
+            _CRED_CACHE.pop(telegram_id, None)
+            _NOT_LINKED.pop(telegram_id, None)
         
         return True, "Successfully linked Google account!", telegram_id
         
@@ -141,40 +223,64 @@ def exchange_code(code: str, state: str) -> Tuple[bool, str, Optional[int]]:
         return False, f"Error exchanging code: {str(e)}", None
 
 
+def _cached_credentials(telegram_id: int) -> Optional[Credentials]:
+    """Return cached credentials that aren't within CRED_CACHE_MARGIN of expiring and still match the stored link"""
+    with _CRED_LOCK:
+        entry = _CRED_CACHE.get(telegram_id)
+    if entry is None:
+        return None
+    credentials, linked_at = entry
+    if credentials.expired:
+        return None
+    # google-auth keeps expiry as naive UTC
+    if credentials.expiry and credentials.expiry - datetime.now(timezone.utc).replace(tzinfo=None) < CRED_CACHE_MARGIN:
+        return None
+    # A primary-key read: catches a re-link or revoke done by another process
+    with _DB_LOCK:
+        row = get_db().execute('SELECT created_at FROM google_tokens WHERE telegram_id = ?', (telegram_id,)).fetchone()
+    if row is None or row[0] != linked_at:
+        with _CRED_LOCK:
+            _CRED_CACHE.pop(telegram_id, None)
+        return None
+    return credentials
+
+
 def get_credentials(telegram_id: int) -> Optional[Credentials]:
     """
     Get valid Google credentials for a user.
     Returns None if user hasn't linked Google or tokens are invalid.
     Automatically refreshes expired tokens.
     """
-    conn = get_db()
-    cursor = conn.cursor()
+    credentials = _cached_credentials(telegram_id)
+    if credentials:
+        return credentials
     
-    cursor.execute(
-        'SELECT access_token, refresh_token, token_expiry, scopes FROM google_tokens WHERE telegram_id = ?',
-        (telegram_id,)
-    )
-    row = cursor.fetchone()
-    conn.close()
+    # One load/refresh per user at a time; concurrent callers wait, then take the cached result
+    with _CRED_LOCK:
+        user_lock = _REFRESH_LOCKS.setdefault(telegram_id, threading.Lock())
+    with user_lock:
+        return _cached_credentials(telegram_id) or _load_credentials(telegram_id)
+
+
+def _load_credentials(telegram_id: int) -> Optional[Credentials]:
+    """Build credentials from the database, refreshing if expired, and cache them"""
+    with _DB_LOCK:
+        row = get_db().execute(
+            'SELECT access_token, refresh_token, token_expiry_epoch, scopes, created_at FROM google_tokens WHERE telegram_id = ?',
+            (telegram_id,)
+        ).fetchone()
     
     if not row:
         return None
     
-    access_token, refresh_token, token_expiry, scopes_json = row
+    access_token, refresh_token, expiry_epoch, scopes_joined, linked_at = row
     
-    # Parse expiry
+    # google-auth expects expiry as naive UTC
     expiry = None
-    if token_expiry:
-        try:
-            expiry = datetime.fromisoformat(token_expiry.replace('Z', '+00:00'))
-        except:
-            pass
+    if expiry_epoch is not None:
+        expiry = datetime.fromtimestamp(expiry_epoch, tz=timezone.utc).replace(tzinfo=None)
     
-    # Parse scopes
-    try:
-        scopes = json.loads(scopes_json)
-    except:
-        scopes = SCOPES
+    scopes = scopes_joined.split('|') if scopes_joined else SCOPES
     
     # Create credentials object
     credentials = Credentials(
@@ -187,49 +293,130 @@ def get_credentials(telegram_id: int) -> Optional[Credentials]:
         expiry=expiry
     )
     
-    # Check if expired and refresh
-    if credentials.expired and credentials.refresh_token:
+    # Check if expired (or about to) and refresh
+    expiring = credentials.expiry and credentials.expiry - datetime.now(timezone.utc).replace(tzinfo=None) < CRED_CACHE_MARGIN
+    if (credentials.expired or expiring) and credentials.refresh_token:
         try:
             credentials.refresh(Request())
             
             # Update stored tokens
-            conn = get_db()
-            cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE google_tokens 
-                SET access_token = ?, token_expiry = ?
-                WHERE telegram_id = ?
-            ''', (
-                credentials.token,
-                credentials.expiry.isoformat() if credentials.expiry else None,
-                telegram_id
-            ))
-            conn.commit()
-            conn.close()
+            with _DB_LOCK:
+                get_db().execute('''
+                    UPDATE google_tokens 
+                    SET access_token = ?, token_expiry = ?, token_expiry_epoch = ?
+                    WHERE telegram_id = ?
+                ''', (
+                    credentials.token,
+                    credentials.expiry.isoformat() if credentials.expiry else None,
+                    _expiry_epoch(credentials),
+                    telegram_id
+                ))
         except Exception as e:
             print(f"Error refreshing token for user {telegram_id}: {e}")
+            with _CRED_LOCK:
+                _CRED_CACHE.pop(telegram_id, None)
             return None
     
+    with _CRED_LOCK:
+        _CRED_CACHE[telegram_id] = (credentials, linked_at)
+        _NOT_LINKED.pop(telegram_id, None)
     return credentials
 
 
-def has_google_credentials(telegram_id: int) -> bool:
-    """Check if user has valid Google credentials"""
-    return get_credentials(telegram_id) is not None
+def has_google_credentials(telegram_id: int, use_cache: bool = True) -> bool:
+    """
+    Check if user has valid Google credentials.
+    A negative answer is remembered for 30s; pass use_cache=False when the user
+    explicitly asks (e.g. right after linking in the browser).
+    """
+    # A cache hit costs one primary-key read; only a miss rebuilds (and refreshes if needed)
+    if _cached_credentials(telegram_id) is not None:
+        return True
+    if use_cache:
+        with _CRED_LOCK:
+            if telegram_id in _NOT_LINKED:
+                return False
+    
+    linked = get_credentials(telegram_id) is not None
+    if not linked:
+        with _CRED_LOCK:
+            _NOT_LINKED[telegram_id] = True
+    return linked
+
+
+def has_google_credentials_bulk(telegram_ids: Iterable[int]) -> Set[int]:
+    """
+    Return the subset of telegram_ids that have linked Google.
+    One query per 900 ids (SQLite's bound-parameter limit) instead of a
+    get_credentials() call - and possible token refresh - per user.
+    """
+    ids = list(telegram_ids)
+    connected = set()
+    if not ids:
+        return connected
+    
+    now = int(datetime.now(timezone.utc).timestamp())
+    with _DB_LOCK:
+        conn = get_db()
+        for i in range(0, len(ids), 900):
+            batch = ids[i:i + 900]
+            placeholders = ",".join("?" * len(batch))
+            # A refresh token means get_credentials() can renew the access token
+            rows = conn.execute(
+                f"SELECT telegram_id FROM google_tokens WHERE telegram_id IN ({placeholders}) "
+                "AND (refresh_token != '' OR token_expiry_epoch > ?)",
+                (*batch, now)
+            ).fetchall()
+            connected.update(row[0] for row in rows)
+    return connected
 
 
 def revoke_credentials(telegram_id: int) -> bool:
     """Remove user's Google credentials"""
     try:
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM google_tokens WHERE telegram_id = ?', (telegram_id,))
-        conn.commit()
-        conn.close()
+        with _CRED_LOCK:
+            _CRED_CACHE.pop(telegram_id, None)
+        with _DB_LOCK:
+            get_db().execute('DELETE FROM google_tokens WHERE telegram_id = ?', (telegram_id,))
         return True
     except:
         return False
 
 
-# Initialize table on module load
-init_google_tokens_table()
+def drive_quote(value: str) -> str:
+    """Escape a value for a single-quoted Drive query string."""
+    return value.replace("\\", "\\\\").replace("'", "\\'")
+
+
+def _cred_key(credentials: Credentials) -> str:
+    raw = f"{credentials.token}|{credentials.client_id}|{credentials.refresh_token}".encode()
+    return hashlib.sha256(raw).hexdigest()[:32]
+
+
+@lru_cache(maxsize=None)
+def _discovery_doc(api: str, version: str) -> Optional[dict]:
+    """Parsed discovery document shipped with googleapiclient, or None if it isn't bundled"""
+    from googleapiclient.discovery_cache import get_static_doc
+    doc = get_static_doc(api, version)
+    return json.loads(doc) if doc else None
+
+
+def get_service(api: str, version: str, credentials: Credentials):
+    """Return a cached googleapiclient service for these credentials"""
+    key = (api, version, _cred_key(credentials))
+    with _SERVICES_LOCK:
+        service = _SERVICES.get(key)
+    if service is None:
+        # Imported here so the admin API can use this module without loading the discovery client
+        from googleapiclient.discovery import build, build_from_document
+        from google_auth_httplib2 import AuthorizedHttp
+        http = AuthorizedHttp(credentials, http=_THREAD_HTTP)
+        # The bundled discovery JSON is parsed once per API rather than on every build()
+        doc = _discovery_doc(api, version)
+        if doc:
+            service = build_from_document(doc, http=http)
+        else:
+            service = build(api, version, http=http, cache_discovery=False)
+        with _SERVICES_LOCK:
+            _SERVICES[key] = service
+    return service
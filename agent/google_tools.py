@@ -2,9 +2,110 @@
 Google Tools - Custom LangChain tools for Google Drive, Sheets, Gmail, Calendar.
 Uses official Google APIs with LangChain Tool wrapper for function calling.
 """
+import os
+import re
+import csv
+import base64
+import datetime
+import threading
+import traceback
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.text import MIMEText
 from typing import List, Any, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from cachetools import TTLCache
 from langchain_core.tools import tool
-from googleapiclient.discovery import build
+from pydantic import BaseModel, Field
+from .caching import get_genai_client
+from .google_auth import get_credentials, get_service, drive_quote, has_google_credentials
+from .chart_tools import get_chart_tools
+from .memory_tools import get_memory_tools
+from .people_tools import get_people_tools
+from .catalogue_tools import get_catalogue_tools
+from .quotation_tools import get_quotation_tools
+from .meet_tools import get_meet_tools
+from .tasks_tools import get_tasks_tools
+
+try:
+    import fitz  # PyMuPDF
+    PDF_AVAILABLE = True
+except ImportError:
+    PDF_AVAILABLE = False
+
+# Max concurrent Gemini calls when reading a PDF from Drive
+GOOGLE_PARALLEL = int(os.getenv("GOOGLE_PARALLEL", "5"))
+# PDF pages narrower than this (in points) are rendered at 2x instead of 1.5x
+PDF_SMALL_PAGE_PT = 1000
+
+# Built tool lists per telegram_id, with the credentials they were built for; the TTL
+# makes long-idle users re-check their connection
+_tools_cache = TTLCache(maxsize=1024, ttl=300)
+_tools_cache_lock = threading.Lock()
+
+# Pooled keep-alive session for Jina Reader, so repeat URL fetches skip the TCP/TLS handshake.
+# Retries only cover connection errors and 502-504 on the idempotent GET.
+_JINA_SESSION = requests.Session()
+_JINA_SESSION.headers.update({
+    'Accept': 'text/plain',
+    'User-Agent': 'Mozilla/5.0 (compatible; TelegramBot/1.0)'
+})
+_JINA_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=8, pool_maxsize=32,
+    max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504))
+))
+
+# File IDs in Google URLs, most specific first
+_DRIVE_ID_PATTERNS = (
+    re.compile(r'/d/([a-zA-Z0-9_-]+)'),  # /d/FILE_ID format
+    re.compile(r'id=([a-zA-Z0-9_-]+)'),  # id=FILE_ID format
+    re.compile(r'^([a-zA-Z0-9_-]{25,})$'),  # Just the ID
+)
+# A bare Drive file ID: a long token of letters, digits, '-' and '_'
+_FILE_ID_RE = re.compile(r'^[A-Za-z0-9_-]{21,}$')
+
+# Folder IDs by (account, parent_id, name), so find-or-create lookups skip the Drive query
+# on repeat use; the TTL bounds how long a trashed or renamed folder can be served
+_folder_cache = TTLCache(maxsize=4096, ttl=300)
+_folder_cache_lock = threading.Lock()
+
+# 'Expenses' spreadsheet ID per account, so add_expense_row skips the Drive search; dropped
+# when an append reports the sheet gone
+_expenses_sheet_cache = TTLCache(maxsize=1024, ttl=3600)
+_expenses_sheet_lock = threading.Lock()
+
+# Drive file listings and searches skip trashed items and folders
+DRIVE_FILES_FILTER = "trashed = false and mimeType != 'application/vnd.google-apps.folder'"
+
+
+class ExpenseRow(BaseModel):
+    """One expense in an add_expense_rows call; the fields mirror add_expense_row's arguments."""
+    date: str = Field(description="Date of purchase (e.g., '2025-01-05')")
+    merchant: str = Field(description="Name of the merchant (e.g., 'Starbucks')")
+    total: str = Field(description="Total amount (e.g., '45.00')")
+    category: str = Field("Uncategorized", description="Optional category (default: 'Uncategorized')")
+
+
+# write_to_spreadsheet input: one row is a run of unquoted text and "quoted" cells; rows end at
+# an unquoted ';' or line break
+_SHEET_ROW_RE = re.compile(r'(?:[^";\r\n]|"[^"]*")*')
+_SHEET_SEP_RE = re.compile(r';|\r?\n')
+
+
+def _split_sheet_rows(values: str) -> List[str]:
+    """Split 'A,B;1,"2;3"' into row strings, leaving separators inside quotes alone."""
+    rows, pos = [], 0
+    while True:
+        end = _SHEET_ROW_RE.match(values, pos).end()
+        rows.append(values[pos:end])
+        sep = _SHEET_SEP_RE.match(values, end)
+        if sep is None:
+            if end < len(values):
+                rows[-1] = values[pos:]  # Unbalanced quote: the rest is one row
+            return rows
+        pos = sep.end()
 
 
 def get_google_tools(telegram_id: int) -> List[Any]:
@@ -12,29 +113,32 @@ def get_google_tools(telegram_id: int) -> List[Any]:
     Get LangChain Google tools for a specific user.
     Creates custom tools that use Google APIs directly.
     """
+    try:
+        credentials = get_credentials(telegram_id)
+    except Exception as e:
+        print(f"[Google Tools] Error loading credentials for user {telegram_id}: {e}")
+        credentials = None
+    
+    # Reuse the tool list built for the same live credentials. get_credentials() hands back the
+    # cached object until it's refreshed or revoked, so a different object (or None) means rebuild.
+    with _tools_cache_lock:
+        cached = _tools_cache.get(telegram_id)
+    if cached is not None and credentials is not None and cached[0] is credentials:
+        return list(cached[1])
+    
     tools = []
     
     # ALWAYS add universal tools (available even without Google connection)
     tools.append(create_connection_check_tool(telegram_id))
     tools.append(create_web_fetch_tool())
     
-    # Add chart tools (no credentials needed)
-    from .chart_tools import get_chart_tools
+    # Add chart tools (no credentials needed; built once and shared by every user)
     tools.extend(get_chart_tools())
     
     try:
-        from .google_auth import get_credentials
-        from .people_tools import get_people_tools
-        from .catalogue_tools import get_catalogue_tools
-        from .quotation_tools import get_quotation_tools
-        from .memory_tools import get_memory_tools
-        from .meet_tools import get_meet_tools
-        from .tasks_tools import get_tasks_tools
-        
         # Add memory tools (always available, no credentials needed)
         tools.extend(get_memory_tools(telegram_id))
         
-        credentials = get_credentials(telegram_id)
         if not credentials:
             print(f"[Google Tools] No credentials for user {telegram_id}")
             return tools  # Return with just the connection check tool + memory tools
@@ -54,18 +158,19 @@ def get_google_tools(telegram_id: int) -> List[Any]:
         
         print(f"[Google Tools] Total tools loaded: {len(tools)}")
         
+        # Only connected users are cached, so a fresh /register_google is picked up on the next turn
+        with _tools_cache_lock:
+            _tools_cache[telegram_id] = (credentials, tools)
+        
     except Exception as e:
         print(f"[Google Tools] Error loading tools for user {telegram_id}: {e}")
-        import traceback
         traceback.print_exc()
     
-    return tools
+    return list(tools)
 
 
 def create_connection_check_tool(telegram_id: int) -> Any:
     """Create a tool that checks if user has Google services connected."""
-    from .google_auth import has_google_credentials
-    
     @tool
     def check_google_connection_status() -> str:
         """
@@ -88,8 +193,9 @@ def create_connection_check_tool(telegram_id: int) -> Any:
     return check_google_connection_status
 
 
+@lru_cache(maxsize=1)
 def create_web_fetch_tool() -> Any:
-    """Create a tool that fetches content from URLs using Jina Reader API."""
+    """Create a tool that fetches content from URLs using Jina Reader API (built once; it holds no user state)."""
     
     @tool
     def fetch_url_content(url: str) -> str:
@@ -105,18 +211,11 @@ def create_web_fetch_tool() -> Any:
             The extracted text content from the page in readable format
         """
         try:
-            import requests
-            
             # Use Jina Reader API - free, handles JavaScript, no API key needed
             # Simply prepend https://r.jina.ai/ to any URL
             jina_url = f"https://r.jina.ai/{url}"
             
-            headers = {
-                'Accept': 'text/plain',
-                'User-Agent': 'Mozilla/5.0 (compatible; TelegramBot/1.0)'
-            }
-            
-            response = requests.get(jina_url, headers=headers, timeout=30)
+            response = _JINA_SESSION.get(jina_url, timeout=30)
             response.raise_for_status()
             
             content = response.text.strip()
@@ -145,7 +244,7 @@ def create_gmail_tools(credentials) -> List[Any]:
     tools = []
     
     try:
-        service = build('gmail', 'v1', credentials=credentials)
+        service = get_service('gmail', 'v1', credentials)
         
         @tool
         def get_my_email_info() -> str:
@@ -165,14 +264,35 @@ def create_gmail_tools(credentials) -> List[Any]:
         def search_gmail(query: str) -> str:
             """Search Gmail inbox. Use queries like 'from:example@gmail.com' or 'subject:meeting'."""
             try:
-                results = service.users().messages().list(userId='me', q=query, maxResults=10).execute()
+                results = service.users().messages().list(
+                    userId='me', q=query, maxResults=5, fields='messages(id)'
+                ).execute()
                 messages = results.get('messages', [])
                 if not messages:
                     return "No messages found matching your query."
                 
+                # One multipart batch request for all metadata fetches instead of a round trip each
+                msgs, errors = {}, []
+                def collect(request_id, response, exception):
+                    if exception is None:
+                        msgs[int(request_id)] = response
+                    else:
+                        errors.append(exception)
+                
+                batch = service.new_batch_http_request(callback=collect)
+                for i, msg in enumerate(messages[:5]):
+                    # Only the three headers shown below, not the whole metadata resource
+                    batch.add(service.users().messages().get(
+                        userId='me', id=msg['id'], format='metadata',
+                        metadataHeaders=['From', 'Subject', 'Date'], fields='payload/headers'
+                    ), request_id=str(i))
+                batch.execute()
+                if errors and not msgs:
+                    raise errors[0]
+                
                 output = []
-                for msg in messages[:5]:
-                    msg_data = service.users().messages().get(userId='me', id=msg['id'], format='metadata').execute()
+                for i in sorted(msgs):
+                    msg_data = msgs[i]
                     headers = {h['name']: h['value'] for h in msg_data['payload']['headers']}
                     output.append(f"From: {headers.get('From', 'Unknown')}\nSubject: {headers.get('Subject', 'No Subject')}\nDate: {headers.get('Date', 'Unknown')}\n")
                 return "\n---\n".join(output)
@@ -204,16 +324,27 @@ def create_gmail_tools(credentials) -> List[Any]:
                 Success or error message
             """
             try:
-                import base64
-                from email.mime.text import MIMEText
-                
-                # Create the email message
-                message = MIMEText(body)
-                message['to'] = to
-                message['subject'] = subject
-                
+                if (to.isascii() and subject.isascii()
+                        and not any(c in to + subject for c in '\r\n')):
+                    # Plain ASCII headers: build the RFC 822 bytes directly
+                    # instead of going through the email package's generator
+                    raw_bytes = (
+                        f"To: {to}\r\n"
+                        f"Subject: {subject}\r\n"
+                        "MIME-Version: 1.0\r\n"
+                        "Content-Type: text/plain; charset=utf-8\r\n"
+                        "Content-Transfer-Encoding: 8bit\r\n"
+                        "\r\n"
+                    ).encode('ascii') + body.encode('utf-8')
+                else:
+                    # Non-ASCII headers need RFC 2047 encoding
+                    message = MIMEText(body, 'plain', 'utf-8')
+                    message['to'] = to
+                    message['subject'] = subject
+                    raw_bytes = message.as_bytes()
+
                 # Encode the message
-                raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
+                raw_message = base64.urlsafe_b64encode(raw_bytes).decode('ascii')
                 
                 # Send it
                 sent_message = service.users().messages().send(
@@ -239,17 +370,49 @@ def create_drive_tools(credentials) -> List[Any]:
     tools = []
     
     try:
-        service = build('drive', 'v3', credentials=credentials)
+        service = get_service('drive', 'v3', credentials)
+        account = (credentials.client_id, credentials.refresh_token or credentials.token)
+        
+        def find_folder(name: str, parent_id: Optional[str] = None, create: bool = False):
+            """Return (folder_id, created) for a folder by name, optionally creating it if missing."""
+            key = (account, parent_id, name)
+            with _folder_cache_lock:
+                folder_id = _folder_cache.get(key)
+            if folder_id:
+                return folder_id, False
+            
+            query = f"name = '{drive_quote(name)}' and mimeType = 'application/vnd.google-apps.folder' and trashed = false"
+            if parent_id:
+                query += f" and '{parent_id}' in parents"
+            folders = service.files().list(q=query, pageSize=1, fields="files(id)").execute().get('files', [])
+            created = False
+            if folders:
+                folder_id = folders[0]['id']
+            elif create:
+                folder_metadata = {
+                    'name': name,
+                    'mimeType': 'application/vnd.google-apps.folder'
+                }
+                if parent_id:
+                    folder_metadata['parents'] = [parent_id]
+                folder_id = service.files().create(body=folder_metadata, fields='id').execute().get('id')
+                created = True
+            
+            if folder_id:
+                with _folder_cache_lock:
+                    _folder_cache[key] = folder_id
+            return folder_id, created
         
         @tool
         def list_drive_files(query: str = "") -> str:
             """List files in Google Drive. Optional query to filter (e.g., 'name contains insurance')."""
             try:
-                q = query if query else None
+                q = f"({query}) and {DRIVE_FILES_FILTER}" if query else DRIVE_FILES_FILTER
                 results = service.files().list(
-                    pageSize=20, 
-                    fields="files(id, name, mimeType, modifiedTime)",
-                    q=q if q else None
+                    pageSize=20,
+                    orderBy="modifiedTime desc",
+                    fields="files(id, name, modifiedTime)",
+                    q=q
                 ).execute()
                 files = results.get('files', [])
                 if not files:
@@ -266,11 +429,10 @@ def create_drive_tools(credentials) -> List[Any]:
         def search_drive_files(search_term: str) -> str:
             """Search for files in Google Drive by name."""
             try:
-                query = f"name contains '{search_term}'"
                 results = service.files().list(
                     pageSize=20,
-                    fields="files(id, name, mimeType, modifiedTime)",
-                    q=query
+                    fields="files(id, name)",
+                    q=f"name contains '{drive_quote(search_term)}' and {DRIVE_FILES_FILTER}"
                 ).execute()
                 files = results.get('files', [])
                 if not files:
@@ -314,26 +476,22 @@ def create_drive_tools(credentials) -> List[Any]:
             Returns:
                 Text content extracted from the PDF or analysis results
             """
+            if not PDF_AVAILABLE:
+                return "❌ PDF processing libraries not installed. Contact admin."
+            
             try:
-                from google import genai
-                import fitz  # PyMuPDF
-                import io
-                from googleapiclient.http import MediaIoBaseDownload
-                import os
-                
                 # Search for the file
                 file_id = None
                 file_name = "PDF file"
                 
                 if "drive.google.com" in file_identifier:
                     # Extract file ID from URL
-                    import re
-                    match = re.search(r'/d/([a-zA-Z0-9_-]+)', file_identifier)
+                    match = _DRIVE_ID_PATTERNS[0].search(file_identifier)
                     if match:
                         file_id = match.group(1)
                     else:
                         return "❌ Invalid Google Drive URL"
-                elif len(file_identifier) > 20 and not " " in file_identifier and file_identifier.replace("-", "").replace("_", "").isalnum():
+                elif _FILE_ID_RE.match(file_identifier):
                     # Looks like a file ID (long alphanumeric string with no spaces)
                     file_id = file_identifier
                     # Try to get the file name
@@ -346,7 +504,7 @@ def create_drive_tools(credentials) -> List[Any]:
                         return f"❌ Could not find file with ID '{file_identifier}': {str(e)}"
                 else:
                     # Search by name
-                    query = f"name contains '{file_identifier}' and mimeType = 'application/pdf' and trashed = false"
+                    query = f"name contains '{drive_quote(file_identifier)}' and mimeType = 'application/pdf' and trashed = false"
                     results = service.files().list(
                         q=query,
                         pageSize=5,
@@ -364,50 +522,48 @@ def create_drive_tools(credentials) -> List[Any]:
                     file_id = files[0]['id']
                     file_name = files[0]['name']
                 
-                # Download the PDF
-                request = service.files().get_media(fileId=file_id)
-                pdf_data = io.BytesIO()
-                downloader = MediaIoBaseDownload(pdf_data, request)
-                done = False
-                while not done:
-                    _, done = downloader.next_chunk()
-                
-                pdf_bytes = pdf_data.getvalue()
-                
-                # Use Gemini Vision to analyze the PDF
+                # Use Gemini Vision to analyze the PDF (checked before downloading anything)
                 api_key = os.getenv("GEMINI_API_KEY")
                 if not api_key:
                     return "❌ GEMINI_API_KEY not configured"
                 
-                client = genai.Client(api_key=api_key)
+                client = get_genai_client()
                 
-                # Convert PDF to images and analyze
-                doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-                analysis_results = []
+                # Download the PDF in a single request straight into PyMuPDF
+                pdf_bytes = service.files().get_media(fileId=file_id).execute()
                 
-                for page_num in range(min(len(doc), 10)):  # Limit to 10 pages
-                    page = doc[page_num]
-                    pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-                    img_bytes = pix.tobytes("png")
-                    
+                def analyze_page(img_bytes):
                     response = client.models.generate_content(
                         model="gemini-2.0-flash-exp",
                         contents=[
-                            {"inline_data": {"mime_type": "image/png", "data": img_bytes}},
+                            {"inline_data": {"mime_type": "image/jpeg", "data": img_bytes}},
                             "Analyze this page and extract all text and information you can find. Be detailed and comprehensive."
                         ]
                     )
-                    
-                    analysis_results.append(f"📄 Page {page_num + 1}:\n{response.text}")
+                    return response.text
                 
-                doc.close()
+                # Pages are rendered one at a time (PyMuPDF isn't thread-safe) and each is sent to
+                # Gemini as soon as it's ready, so rendering overlaps with the in-flight calls
+                doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+                with ThreadPoolExecutor(max_workers=GOOGLE_PARALLEL) as pool:
+                    futures = []
+                    for page_num in range(min(len(doc), 10)):  # Limit to 10 pages
+                        page = doc[page_num]
+                        # JPEG is far smaller and cheaper to encode than PNG; only small pages get the 2x zoom
+                        zoom = 2.0 if page.rect.width < PDF_SMALL_PAGE_PT else 1.5
+                        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+                        futures.append(pool.submit(analyze_page, pix.tobytes("jpeg", jpg_quality=80)))
+                    doc.close()
+                    page_texts = [f.result() for f in futures]
+                
+                analysis_results = [
+                    f"📄 Page {page_num + 1}:\n{text}" for page_num, text in enumerate(page_texts)
+                ]
                 
                 return f"📁 Analysis of '{file_name}':\n\n" + "\n\n".join(analysis_results)
                 
-            except ImportError:
-                return "❌ PDF processing libraries not installed. Contact admin."
             except Exception as e:
-                import traceback
+                print(f"[Google Tools] Error reading PDF {file_identifier!r}: {e}")
                 traceback.print_exc()
                 return f"❌ Error reading PDF: {str(e)}"
         
@@ -430,33 +586,13 @@ def create_drive_tools(credentials) -> List[Any]:
                 
                 # Find parent folder if specified
                 if parent_folder_name:
-                    query = f"name = '{parent_folder_name}' and mimeType = 'application/vnd.google-apps.folder' and trashed = false"
-                    results = service.files().list(q=query, fields="files(id, name)").execute()
-                    files = results.get('files', [])
-                    if files:
-                        parent_id = files[0]['id']
+                    parent_id, _ = find_folder(parent_folder_name)
                 
-                # Check if folder already exists
-                check_query = f"name = '{folder_name}' and mimeType = 'application/vnd.google-apps.folder' and trashed = false"
-                if parent_id:
-                    check_query += f" and '{parent_id}' in parents"
-                
-                existing = service.files().list(q=check_query, fields="files(id, name)").execute()
-                if existing.get('files'):
-                    folder_id = existing['files'][0]['id']
+                # Reuse the folder if it already exists, otherwise create it
+                folder_id, created = find_folder(folder_name, parent_id, create=True)
+                if not created:
                     return f"📁 Folder '{folder_name}' already exists. ID: {folder_id}"
                 
-                # Create the folder
-                file_metadata = {
-                    'name': folder_name,
-                    'mimeType': 'application/vnd.google-apps.folder'
-                }
-                if parent_id:
-                    file_metadata['parents'] = [parent_id]
-                
-                folder = service.files().create(body=file_metadata, fields='id').execute()
-                folder_id = folder.get('id')
-                
                 return f"✅ Created folder '{folder_name}'. ID: {folder_id}"
                 
             except Exception as e:
@@ -477,30 +613,13 @@ def create_drive_tools(credentials) -> List[Any]:
                 Success message with file link
             """
             try:
-                from bot.config import telegram_agent
-                from googleapiclient.http import MediaIoBaseUpload
-                import io
-                
                 # Get file context
                 # We need to figure out the telegram_id - this is captured in closure
                 # But upload_file_to_folder is a generic tool, need a different approach
                 # For now, return instruction
                 
                 # First, find or create the folder
-                query = f"name = '{folder_name}' and mimeType = 'application/vnd.google-apps.folder' and trashed = false"
-                results = service.files().list(q=query, fields="files(id, name)").execute()
-                folders = results.get('files', [])
-                
-                if folders:
-                    folder_id = folders[0]['id']
-                else:
-                    # Create the folder
-                    folder_metadata = {
-                        'name': folder_name,
-                        'mimeType': 'application/vnd.google-apps.folder'
-                    }
-                    folder = service.files().create(body=folder_metadata, fields='id').execute()
-                    folder_id = folder.get('id')
+                folder_id, _ = find_folder(folder_name, create=True)
                 
                 return f"✅ Folder '{folder_name}' is ready. ID: {folder_id}\n\nTo save the uploaded file there, use the save_catalogue tool with folder support or I'll move the file for you."
                 
@@ -530,21 +649,13 @@ def create_drive_tools(credentials) -> List[Any]:
             Returns:
                 Success message with new file link or error
             """
-            import re
-            
             try:
                 # Extract file ID from URL if needed
                 file_id = file_url_or_id
                 
                 # Try to extract ID from various Google URL formats
-                url_patterns = [
-                    r'/d/([a-zA-Z0-9_-]+)',  # /d/FILE_ID format
-                    r'id=([a-zA-Z0-9_-]+)',  # id=FILE_ID format
-                    r'^([a-zA-Z0-9_-]{25,})$'  # Just the ID
-                ]
-                
-                for pattern in url_patterns:
-                    match = re.search(pattern, file_url_or_id)
+                for pattern in _DRIVE_ID_PATTERNS:
+                    match = pattern.search(file_url_or_id)
                     if match:
                         file_id = match.group(1)
                         break
@@ -560,21 +671,8 @@ def create_drive_tools(credentials) -> List[Any]:
                 # Determine destination folder
                 folder_id = None
                 if destination_folder:
-                    # Search for folder
-                    query = f"name = '{destination_folder}' and mimeType = 'application/vnd.google-apps.folder' and trashed = false"
-                    results = service.files().list(q=query, fields="files(id)").execute()
-                    folders = results.get('files', [])
-                    
-                    if folders:
-                        folder_id = folders[0]['id']
-                    else:
-                        # Create the folder
-                        folder_metadata = {
-                            'name': destination_folder,
-                            'mimeType': 'application/vnd.google-apps.folder'
-                        }
-                        folder = service.files().create(body=folder_metadata, fields='id').execute()
-                        folder_id = folder.get('id')
+                    # Find or create the folder
+                    folder_id, _ = find_folder(destination_folder, create=True)
                 
                 # Prepare copy metadata
                 copy_name = new_name if new_name else f"Copy of {original_name}"
@@ -615,7 +713,7 @@ def create_drive_tools(credentials) -> List[Any]:
                 return output
                 
             except Exception as e:
-                import traceback
+                print(f"[Google Tools] Error copying file {file_url_or_id!r}: {e}")
                 traceback.print_exc()
                 return f"❌ Error copying file: {str(e)}"
         
@@ -633,7 +731,8 @@ def create_sheets_tools(credentials) -> List[Any]:
     tools = []
     
     try:
-        service = build('sheets', 'v4', credentials=credentials)
+        service = get_service('sheets', 'v4', credentials)
+        account = (credentials.client_id, credentials.refresh_token or credentials.token)
         
         @tool
         def read_spreadsheet(spreadsheet_id: str, range_name: str = "Sheet1!A1:Z100") -> str:
@@ -668,12 +767,13 @@ def create_sheets_tools(credentials) -> List[Any]:
         
         @tool
         def write_to_spreadsheet(spreadsheet_id: str, range_name: str, values: str) -> str:
-            """Write data to a Google Spreadsheet. Values should be comma-separated, rows separated by semicolons. Example: 'A,B,C;1,2,3'"""
+            """Write data to a Google Spreadsheet. Values should be comma-separated, rows separated by semicolons. Example: 'A,B,C;1,2,3'. Wrap a cell containing a comma or semicolon in double quotes."""
             try:
-                # Parse the values string
-                rows = []
-                for row_str in values.split(';'):
-                    rows.append([cell.strip() for cell in row_str.split(',')])
+                # Parse the values string; quoted cells ("a,b" or "a;b") stay whole, an empty row is one empty cell
+                rows = [
+                    [cell.strip() for cell in row] or ['']
+                    for row in csv.reader(_split_sheet_rows(values), skipinitialspace=True)
+                ]
                 
                 body = {'values': rows}
                 result = service.spreadsheets().values().update(
@@ -696,6 +796,62 @@ def create_sheets_tools(credentials) -> List[Any]:
             except Exception as e:
                 return f"Error creating spreadsheet: {str(e)}"
 
+        def expenses_spreadsheet_id() -> str:
+            """Find the user's 'Expenses' spreadsheet, creating it with a header row if missing."""
+            with _expenses_sheet_lock:
+                spreadsheet_id = _expenses_sheet_cache.get(account)
+            if spreadsheet_id:
+                return spreadsheet_id
+            
+            # Search for a sheet named "Expenses" (file search is a Drive API call, not Sheets)
+            query = "name = 'Expenses' and mimeType = 'application/vnd.google-apps.spreadsheet' and trashed = false"
+            drive = get_service('drive', 'v3', credentials)
+            results = drive.files().list(q=query, spaces='drive', pageSize=1, fields='files(id)').execute()
+            files = results.get('files', [])
+            
+            if files:
+                spreadsheet_id = files[0]['id']
+                with _expenses_sheet_lock:
+                    _expenses_sheet_cache[account] = spreadsheet_id
+                return spreadsheet_id
+            
+            # Create new sheet if not found
+            spreadsheet = {'properties': {'title': 'Expenses'}}
+            spreadsheet = service.spreadsheets().create(body=spreadsheet, fields='spreadsheetId').execute()
+            spreadsheet_id = spreadsheet.get('spreadsheetId')
+            
+            # Add header row
+            header = [['Date', 'Merchant', 'Total', 'Category', 'Added At']]
+            service.spreadsheets().values().update(
+                spreadsheetId=spreadsheet_id, 
+                range='Sheet1!A1', 
+                valueInputOption='RAW', 
+                body={'values': header}
+            ).execute()
+            with _expenses_sheet_lock:
+                _expenses_sheet_cache[account] = spreadsheet_id
+            return spreadsheet_id
+        
+        def append_expenses(values: List[list]) -> None:
+            """Append expense rows to the 'Expenses' sheet in a single Sheets API call."""
+            added_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            body = {'values': [row + [added_at] for row in values]}
+            for attempt in range(2):
+                try:
+                    service.spreadsheets().values().append(
+                        spreadsheetId=expenses_spreadsheet_id(),
+                        range='Sheet1!A:E',
+                        valueInputOption='USER_ENTERED',
+                        body=body
+                    ).execute()
+                    return
+                except Exception as e:
+                    # A cached ID whose sheet was deleted: forget it and look the sheet up again once
+                    if attempt or getattr(getattr(e, 'resp', None), 'status', None) != 404:
+                        raise
+                    with _expenses_sheet_lock:
+                        _expenses_sheet_cache.pop(account, None)
+
         @tool
         def add_expense_row(date: str, merchant: str, total: str, category: str = "Uncategorized") -> str:
             """
@@ -707,48 +863,31 @@ def create_sheets_tools(credentials) -> List[Any]:
             - category: Optional category (default: 'Uncategorized')
             """
             try:
-                # Find or create 'Expenses' sheet
-                import datetime
-                
-                # Search for a sheet named "Expenses"
-                query = "name = 'Expenses' and mimeType = 'application/vnd.google-apps.spreadsheet'"
-                results = service.files().list(q=query, spaces='drive', fields='files(id, name)').execute()
-                files = results.get('files', [])
-                
-                if not files:
-                    # Create new sheet if not found
-                    spreadsheet = {'properties': {'title': 'Expenses'}}
-                    spreadsheet = service.spreadsheets().create(body=spreadsheet, fields='spreadsheetId').execute()
-                    spreadsheet_id = spreadsheet.get('spreadsheetId')
-                    
-                    # Add header row
-                    header = [['Date', 'Merchant', 'Total', 'Category', 'Added At']]
-                    service.spreadsheets().values().update(
-                        spreadsheetId=spreadsheet_id, 
-                        range='Sheet1!A1', 
-                        valueInputOption='RAW', 
-                        body={'values': header}
-                    ).execute()
-                else:
-                    spreadsheet_id = files[0]['id']
-                    
-                # Append row
-                added_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                values = [[date, merchant, total, category, added_at]]
-                
-                service.spreadsheets().values().append(
-                    spreadsheetId=spreadsheet_id,
-                    range='Sheet1!A:E',
-                    valueInputOption='USER_ENTERED',
-                    body={'values': values}
-                ).execute()
-                
+                append_expenses([[date, merchant, total, category]])
                 return f"✅ Added expense to 'Expenses' sheet: {merchant} - ${total}"
             except Exception as e:
                 return f"Error adding expense: {str(e)}"
 
-        tools.extend([read_spreadsheet, get_spreadsheet_info, write_to_spreadsheet, create_spreadsheet, add_expense_row])
-        print(f"[Google Tools] Loaded 5 Sheets tools")
+        @tool
+        def add_expense_rows(expenses: List[ExpenseRow]) -> str:
+            """
+            Add several expense rows to the 'Expenses' sheet in one call (e.g. every line of a receipt batch).
+            Prefer this over calling add_expense_row repeatedly.
+            Arguments:
+            - expenses: One entry per expense, with the same fields as add_expense_row's arguments
+            """
+            if not expenses:
+                return "❌ No expenses given."
+            values = [[e.date, e.merchant, e.total, e.category or "Uncategorized"] for e in expenses]
+            try:
+                append_expenses(values)
+                return f"✅ Added {len(values)} expenses to 'Expenses' sheet"
+            except Exception as e:
+                return f"Error adding expenses: {str(e)}"
+
+        tools.extend([read_spreadsheet, get_spreadsheet_info, write_to_spreadsheet, create_spreadsheet,
+                      add_expense_row, add_expense_rows])
+        print(f"[Google Tools] Loaded 6 Sheets tools")
         
     except Exception as e:
         print(f"[Google Tools] Failed to create Sheets tools: {e}")
@@ -761,7 +900,7 @@ def create_calendar_tools(credentials) -> List[Any]:
     tools = []
     
     try:
-        service = build('calendar', 'v3', credentials=credentials)
+        service = get_service('calendar', 'v3', credentials)
         
         @tool
         def list_calendar_events(days_ahead: int = 1) -> str:
@@ -775,8 +914,6 @@ def create_calendar_tools(credentials) -> List[Any]:
                 List of upcoming events with dates and times
             """
             try:
-                import datetime
-                
                 # Malaysia timezone: UTC+8 (hardcoded, doesn't depend on server locale)
                 MY_TZ = datetime.timezone(datetime.timedelta(hours=8))
                 now_my = datetime.datetime.now(MY_TZ)
@@ -802,7 +939,9 @@ def create_calendar_tools(credentials) -> List[Any]:
                     timeMax=time_max,
                     maxResults=20,
                     singleEvents=True,
-                    orderBy='startTime'
+                    orderBy='startTime',
+                    # Only what the listing below shows; attendees, conference data etc. are skipped
+                    fields='items(start,summary,location)'
                 ).execute()
                 
                 events = events_result.get('items', [])
@@ -835,7 +974,7 @@ def create_calendar_tools(credentials) -> List[Any]:
                 return "\n".join(output)
                 
             except Exception as e:
-                import traceback
+                print(f"[Google Tools] Error listing calendar events: {e}")
                 traceback.print_exc()
                 return f"Error listing events: {str(e)}"
         
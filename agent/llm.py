@@ -3,16 +3,25 @@ LangChain LLM wrapper for Gemini with tool execution and streaming thinking.
 Streams tokens in real-time and executes tools when the model requests them.
 """
 import os
+import re
 import time
+import threading
+from collections import deque
 from dataclasses import dataclass
-from typing import Optional, List, Dict, Any, Callable
+from typing import Optional, List, Any, Callable
 
+from cachetools import TTLCache
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, ToolMessage, BaseMessage
 
 from .memory import memory_manager
 from .tool_memory import ToolSessionMemory
 
+# Chart markers in tool results, e.g. "CHART_FILE:mem:chart_....png"
+_CHART_RE = re.compile(r'CHART_FILE:(\S+)')
+# Lowercase markers that flag a tool result as a failure for the session memory
+_ERR_TOKENS = ("❌", "error", "not found", "no items found", "no files found", "failed", "timeout", "503")
+
 
 @dataclass
 class AgentConfig:
@@ -89,19 +98,27 @@ class TelegramAgent:
         # Note: Tools are bound per-request in _get_llm_with_user_tools()
         # to support per-user Google API credentials
         
-        # Conversation history per user
-        self.conversations: Dict[int, List[Any]] = {}
+        # Per-user state is bounded and expires when idle, so users who stop chatting (or a request
+        # that crashed before clearing its file) don't keep memory for the life of the process.
+        # TTLCache isn't thread-safe and messages are processed on a thread pool, hence the lock.
+        self._state_lock = threading.Lock()
+        
+        # Conversation history per user (expiry restarts on every new message)
+        self.conversations: TTLCache = TTLCache(maxsize=2000, ttl=7200)
         
         # File context storage: {user_id: (file_bytes, filename, mime_type)}
-        self.current_file_context: Dict[int, tuple] = {}
+        self.current_file_context: TTLCache = TTLCache(maxsize=500, ttl=600)
         
         # Tool session memory per user - tracks failed/successful calls within a session
-        self.tool_sessions: Dict[int, ToolSessionMemory] = {}
+        self.tool_sessions: TTLCache = TTLCache(maxsize=2000, ttl=7200)
     
-    def get_history(self, user_id: int) -> List[Any]:
-        if user_id not in self.conversations:
-            self.conversations[user_id] = []
-        return self.conversations[user_id]
+    def get_history(self, user_id: int) -> deque:
+        with self._state_lock:
+            history = self.conversations.get(user_id)
+            if history is None:
+                # The last 20 messages; older ones fall off the front as new ones are appended
+                history = self.conversations[user_id] = deque(maxlen=20)
+        return history
     
     def add_to_history(self, user_id: int, role: str, content: str):
         history = self.get_history(user_id)
@@ -109,29 +126,35 @@ class TelegramAgent:
             history.append(HumanMessage(content=content))
         else:
             history.append(AIMessage(content=content))
-        if len(history) > 20:
-            self.conversations[user_id] = history[-20:]
+        # Re-storing restarts the idle timer
+        with self._state_lock:
+            self.conversations[user_id] = history
     
     def clear_history(self, user_id: int):
-        self.conversations[user_id] = []
+        with self._state_lock:
+            self.conversations[user_id] = deque(maxlen=20)
     
     def set_current_file_context(self, user_id: int, file_bytes: bytes, filename: str, mime_type: str):
         """Store file context for the current message processing."""
-        self.current_file_context[user_id] = (file_bytes, filename, mime_type)
+        with self._state_lock:
+            self.current_file_context[user_id] = (file_bytes, filename, mime_type)
     
     def get_current_file_context(self, user_id: int) -> Optional[tuple]:
         """Get file context for the current message."""
-        return self.current_file_context.get(user_id)
+        with self._state_lock:
+            return self.current_file_context.get(user_id)
     
     def clear_current_file_context(self, user_id: int):
         """Clear file context after processing."""
-        if user_id in self.current_file_context:
-            del self.current_file_context[user_id]
+        with self._state_lock:
+            self.current_file_context.pop(user_id, None)
     
     def clear_tool_session(self, user_id: int):
         """Clear tool session memory after request completes."""
-        if user_id in self.tool_sessions:
-            self.tool_sessions[user_id].clear()
+        with self._state_lock:
+            session = self.tool_sessions.get(user_id)
+        if session is not None:
+            session.clear()
     
     def _get_tools_for_user(self, user_id: int) -> List[Any]:
         """Get tools for a specific user. Always returns at least the connection check tool."""
@@ -165,6 +188,8 @@ class TelegramAgent:
         """
         # Get user's tools
         tools = self._get_tools_for_user(user_id)
+        # Name -> tool for dispatching tool calls (first one wins on a duplicate name, as before)
+        tools_by_name = {t.name: t for t in reversed(tools)}
         
         # Bind tools if available
         if tools:
@@ -226,34 +251,25 @@ class TelegramAgent:
             content = [{"type": "text", "text": message}]
             
             # Add images
-            if images:
-                for img_bytes in images:
-                    b64 = base64.b64encode(img_bytes).decode()
-                    content.append({
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/jpeg;base64,{b64}"}
-                    })
+            content += [
+                {
+                    "type": "image_url",
+                    "image_url": {"url": "data:image/jpeg;base64," + base64.b64encode(img_bytes).decode('ascii')}
+                }
+                for img_bytes in images or ()
+            ]
             
-            # Add audio
-            if audio:
-                for audio_bytes, mime_type in audio:
-                    b64 = base64.b64encode(audio_bytes).decode()
-                    # Gemini expects inline data for audio
-                    content.append({
-                        "type": "media",
-                        "mime_type": mime_type,
-                        "data": b64
-                    })
+            # Add audio (Gemini expects inline data for audio)
+            content += [
+                {"type": "media", "mime_type": mime_type, "data": base64.b64encode(audio_bytes).decode('ascii')}
+                for audio_bytes, mime_type in audio or ()
+            ]
             
             # Add PDFs
-            if pdfs:
-                for pdf_bytes in pdfs:
-                    b64 = base64.b64encode(pdf_bytes).decode()
-                    content.append({
-                        "type": "media",
-                        "mime_type": "application/pdf",
-                        "data": b64
-                    })
+            content += [
+                {"type": "media", "mime_type": "application/pdf", "data": base64.b64encode(pdf_bytes).decode('ascii')}
+                for pdf_bytes in pdfs or ()
+            ]
                     
             messages.append(HumanMessage(content=content))
         else:
@@ -268,9 +284,12 @@ class TelegramAgent:
             chart_files = []  # Track chart files from tool results
             
             # Initialize or get session memory for this user
-            if user_id not in self.tool_sessions:
-                self.tool_sessions[user_id] = ToolSessionMemory()
-            session_memory = self.tool_sessions[user_id]
+            with self._state_lock:
+                session_memory = self.tool_sessions.get(user_id)
+                if session_memory is None:
+                    session_memory = ToolSessionMemory()
+                # Re-storing restarts the idle timer
+                self.tool_sessions[user_id] = session_memory
             
             while iteration < max_iterations:
                 iteration += 1
@@ -311,31 +330,27 @@ class TelegramAgent:
                             tool_result = "Tool not found"
                             tool_success = False
                             
-                            for tool in tools:
-                                if tool.name == tool_name:
-                                    try:
-                                        tool_result = tool.invoke(tool_args)
-                                        print(f"[LLM] Tool result: {str(tool_result)[:200]}...")
-                                        
-                                        # Determine success based on result content
-                                        result_str = str(tool_result).lower()
-                                        tool_success = not any(x in result_str for x in [
-                                            "❌", "error", "not found", "no items found", 
-                                            "no files found", "failed", "timeout", "503"
-                                        ])
+                            tool = tools_by_name.get(tool_name)
+                            if tool is not None:
+                                try:
+                                    tool_result = tool.invoke(tool_args)
+                                    print(f"[LLM] Tool result: {str(tool_result)[:200]}...")
+                                    
+                                    # Determine success based on result content
+                                    result_str = str(tool_result)
+                                    result_lower = result_str.lower()
+                                    tool_success = not any(x in result_lower for x in _ERR_TOKENS)
+                                    
+                                    # Capture chart files from tool results
+                                    if "CHART_FILE:" in result_str:
+                                        chart_matches = _CHART_RE.findall(result_str)
+                                        chart_files.extend(chart_matches)
+                                        print(f"[LLM] Captured chart files: {chart_matches}")
                                         
-                                        # Capture chart files from tool results
-                                        if "CHART_FILE:" in str(tool_result):
-                                            import re
-                                            chart_matches = re.findall(r'CHART_FILE:([^\s]+)', str(tool_result))
-                                            chart_files.extend(chart_matches)
-                                            print(f"[LLM] Captured chart files: {chart_matches}")
-                                            
-                                    except Exception as e:
-                                        tool_result = f"Error executing tool: {str(e)}"
-                                        tool_success = False
-                                        print(f"[LLM] Tool error: {e}")
-                                    break
+                                except Exception as e:
+                                    tool_result = f"Error executing tool: {str(e)}"
+                                    tool_success = False
+                                    print(f"[LLM] Tool error: {e}")
                             
                             # NEW: Record the tool call result
                             session_memory.record_call(tool_name, tool_args, str(tool_result), tool_success)
@@ -7,9 +7,7 @@ import os
 from typing import Optional, List, Any
 from datetime import datetime, timedelta, timezone
 from langchain_core.tools import tool
-from googleapiclient.discovery import build
-
-from .google_auth import get_credentials
+from .google_auth import get_credentials, get_service
 
 
 # Malaysia timezone
@@ -25,8 +23,8 @@ def get_meet_tools(telegram_id: int) -> List[Any]:
         return tools
     
     try:
-        calendar_service = build('calendar', 'v3', credentials=credentials)
-        gmail_service = build('gmail', 'v1', credentials=credentials)
+        calendar_service = get_service('calendar', 'v3', credentials)
+        gmail_service = get_service('gmail', 'v1', credentials)
     except Exception as e:
         print(f"[Meet Tools] Failed to create services: {e}")
         return tools
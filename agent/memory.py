@@ -22,10 +22,8 @@ class GoogleEmbeddings:
     def _init_client(self):
         """Initialize the Google GenAI client."""
         try:
-            from google import genai
-            api_key = os.getenv("GEMINI_API_KEY")
-            if api_key:
-                self.client = genai.Client(api_key=api_key)
+            from .caching import get_genai_client
+            self.client = get_genai_client()
         except Exception as e:
             print(f"[Memory] Could not init Google client: {e}")
     
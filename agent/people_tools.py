@@ -5,7 +5,7 @@ Provides tools to save and search contacts via Google People API.
 
 from typing import Optional, List, Dict
 from langchain_core.tools import tool
-from .google_auth import get_credentials
+from .google_auth import get_credentials, get_service
 
 
 def get_people_tools(telegram_id: int) -> list:
@@ -19,8 +19,7 @@ def get_people_tools(telegram_id: int) -> list:
         return []
     
     try:
-        from googleapiclient.discovery import build
-        service = build('people', 'v1', credentials=credentials)
+        service = get_service('people', 'v1', credentials)
     except Exception as e:
         print(f"[People] Error building service: {e}")
         return []
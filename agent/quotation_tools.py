@@ -9,10 +9,9 @@ import json
 from datetime import datetime, timedelta, timezone
 from typing import Optional, List, Dict, Any
 from langchain_core.tools import tool
-from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
 
-from .google_auth import get_credentials
+from .google_auth import get_credentials, get_service
 
 
 # Malaysia timezone
@@ -51,10 +50,10 @@ def get_quotation_tools(telegram_id: int) -> list:
         return []
     
     try:
-        # Build services with default settings (timeout is handled by retry logic)
-        drive_service = build('drive', 'v3', credentials=credentials)
-        docs_service = build('docs', 'v1', credentials=credentials)
-        sheets_service = build('sheets', 'v4', credentials=credentials)
+        # Cached services with default settings (timeout is handled by retry logic)
+        drive_service = get_service('drive', 'v3', credentials)
+        docs_service = get_service('docs', 'v1', credentials)
+        sheets_service = get_service('sheets', 'v4', credentials)
     except Exception as e:
         print(f"[Quotation] Error building services: {e}")
         return []
@@ -780,8 +779,7 @@ You can now create quotations using this template!"""
             
             pdf_bytes = pdf_data.getvalue()
             
-            # Build Gmail service
-            gmail_service = build('gmail', 'v1', credentials=credentials)
+            gmail_service = get_service('gmail', 'v1', credentials)
             
             # Create email
             msg = MIMEMultipart()
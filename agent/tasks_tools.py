@@ -7,9 +7,7 @@ import os
 from typing import Optional, List, Any
 from datetime import datetime, timedelta, timezone
 from langchain_core.tools import tool
-from googleapiclient.discovery import build
-
-from .google_auth import get_credentials
+from .google_auth import get_credentials, get_service
 
 
 # Malaysia timezone
@@ -28,7 +26,7 @@ def get_tasks_tools(telegram_id: int) -> List[Any]:
         return tools
     
     try:
-        service = build('tasks', 'v1', credentials=credentials)
+        service = get_service('tasks', 'v1', credentials)
     except Exception as e:
         print(f"[Tasks Tools] Failed to create service: {e}")
         return tools
@@ -28,7 +28,7 @@ def get_vision_tools() -> List[Any]:
             To process this receipt:
             1. Just look at the image I sent you.
             2. Extract: Date, Merchant Name, Total Amount, and Category (Food, Transport, etc.).
-            3. Then call the 'add_expense_row' tool with these values.
+            3. Then call the 'add_expense_row' tool with these values (or 'add_expense_rows' once for several receipts).
             """
             
         except Exception as e:
@@ -112,7 +112,7 @@ Type /help for all commands. Let's get started!"""
         from agent.google_auth import get_auth_url, has_google_credentials
         
         # Check if already linked
-        if has_google_credentials(telegram_id):
+        if has_google_credentials(telegram_id, use_cache=False):
             send_reply(
                 chat_id,
                 "✅ Your Google account is already connected!\n\n"
@@ -145,7 +145,7 @@ Type /help for all commands. Let's get started!"""
     # Handle /google_status command
     if text == "/google_status":
         from agent.google_auth import has_google_credentials
-        linked = has_google_credentials(telegram_id)
+        linked = has_google_credentials(telegram_id, use_cache=False)
         if linked:
             send_reply(chat_id, "✅ Your Google account is connected! You can use Google services.")
         else:
@@ -173,15 +173,19 @@ def save_media(file_bytes, original_name):
     return filename
 
 
-def send_photo(chat_id, photo_path, caption=None):
-    """Send a photo to the chat"""
+def send_photo(chat_id, photo_path, caption=None, filename="chart.png"):
+    """Send a photo to the chat (a file path, or image bytes named by filename)"""
     url = f"{base_url}/sendPhoto"
     
-    with open(photo_path, "rb") as photo_file:
-        data = {"chat_id": chat_id}
-        if caption:
-            data["caption"] = caption
-        response = requests.post(url, data=data, files={"photo": photo_file})
+    data = {"chat_id": chat_id}
+    if caption:
+        data["caption"] = caption
+    
+    if isinstance(photo_path, bytes):
+        response = requests.post(url, data=data, files={"photo": (filename, photo_path)})
+    else:
+        with open(photo_path, "rb") as photo_file:
+            response = requests.post(url, data=data, files={"photo": photo_file})
     
     result = response.json()
     if result.get("ok"):
@@ -323,9 +327,16 @@ def send_conversational_response(chat_id: int, response: str, voice_enabled: boo
             chart_path = chart_path.strip()
             print(f"[Telegram] Checking chart path: {chart_path}")
             
-            if os.path.exists(chart_path):
+            # In-memory charts are referenced as mem:<id>; older ones are file paths
+            if chart_path.startswith("mem:"):
+                from agent.chart_tools import pop_chart
+                chart = pop_chart(chart_path[4:])
+            else:
+                chart = chart_path if os.path.exists(chart_path) else None
+            
+            if chart:
                 print(f"[Telegram] Sending chart: {chart_path}")
-                result = send_photo(chat_id, chart_path)
+                result = send_photo(chat_id, chart, filename=os.path.basename(chart_path))
                 if result:
                     print(f"[Telegram] Chart sent successfully")
                 else: